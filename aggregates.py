@@ -0,0 +1,136 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+from types import MappingProxyType
+import load_data
+import plots
+
+# Earliest year in the consumer outcomes data, and so the first year on the "Analysis by Year" slider
+FIRST_YEAR = 2014
+
+
+class DenseCounts:
+    # The sum of Count (and the number of rows) for every combination of the given dimensions, held as dense
+    # arrays so any selection can be sliced out without scanning the table again.
+    # Instances are compared by identity, so the chart cache keys them like the shared tables.
+    def __init__(self, table, dimensions):
+        self.dimensions = list(dimensions)
+        self.labels = []
+        self.categorical = []
+        codes = []
+        for col in self.dimensions:
+            values = table[col]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                codes.append(values.cat.codes.to_numpy())
+                self.labels.append(values.cat.categories)
+            else:
+                col_codes, labels = pd.factorize(values, sort=True)
+                codes.append(col_codes)
+                self.labels.append(labels)
+            self.categorical.append(isinstance(values.dtype, pd.CategoricalDtype))
+        shape = tuple(len(labels) for labels in self.labels)
+        # Rows with a missing dimension value are left out, as they are by a group-by
+        valid = np.all([col_codes >= 0 for col_codes in codes], axis=0) if codes else np.ones(len(table), dtype=bool)
+        flat = np.ravel_multi_index([col_codes[valid] for col_codes in codes], shape)
+        size = int(np.prod(shape))
+        counts = np.nan_to_num(table['Count'].to_numpy(dtype=np.float64)[valid])
+        self.sums = np.bincount(flat, weights=counts, minlength=size).reshape(shape)
+        self.rows = np.bincount(flat, minlength=size).reshape(shape)
+        # Position of the first row of each combination, so values can be listed in the order they appear in the table
+        first = np.full(size, len(table))
+        np.minimum.at(first, flat, np.flatnonzero(valid))
+        self.first = first.reshape(shape)
+
+    def positions(self, selection):
+        # Index of the selected labels along each dimension (a single label, a list of labels, or everything)
+        positions = []
+        for dim, labels in zip(self.dimensions, self.labels):
+            chosen = selection.get(dim)
+            if chosen is None:
+                positions.append(np.arange(len(labels)))
+            else:
+                chosen = [chosen] if np.isscalar(chosen) else list(chosen)
+                index = labels.get_indexer(chosen) if len(chosen) else np.array([], dtype=np.intp)
+                positions.append(np.unique(index[index >= 0]))
+        return positions
+
+    def values(self, dimension, selection=None):
+        # Labels of a dimension that have rows within the selection, in the order they first appear in the table
+        positions = self.positions(selection or {})
+        axis = self.dimensions.index(dimension)
+        first = self.first[np.ix_(*positions)]
+        first = first.min(axis=tuple(i for i in range(first.ndim) if i != axis), initial=self.first.size)
+        present = first < self.first.size
+        order = np.argsort(first[present], kind='stable')
+        return list(self.labels[axis][positions[axis][present][order]])
+
+    def frame(self, selection, columns):
+        # Equivalent to filtering the table on the selection and grouping by the columns (in that order) with
+        # observed=True: one row per combination that appears in the table, with the summed Count
+        positions = self.positions(selection)
+        if any(len(index) == 0 for index in positions):
+            return pd.DataFrame({col: [] for col in columns + ['Count']})
+        axes = [self.dimensions.index(col) for col in columns]
+        other = [i for i in range(len(self.dimensions)) if i not in axes]
+        block = np.ix_(*positions)
+        # Move the grouped dimensions to the front (in order) and add up over the selected labels of the rest
+        sums = np.transpose(self.sums[block], axes + other).reshape([len(positions[i]) for i in axes] + [-1]).sum(axis=-1)
+        rows = np.transpose(self.rows[block], axes + other).reshape([len(positions[i]) for i in axes] + [-1]).sum(axis=-1)
+        found = np.nonzero(rows)
+        data = {}
+        for col, axis, index in zip(columns, axes, found):
+            codes = positions[axis][index]
+            if self.categorical[axis]:
+                data[col] = pd.Categorical.from_codes(codes, categories=self.labels[axis])
+            else:
+                data[col] = self.labels[axis][codes]
+        data['Count'] = sums[found]
+        return pd.DataFrame(data)
+
+
+def tables_by_year(table, years):
+    # Split a table into one slice per year (years without any rows get an empty slice)
+    groups = dict(tuple(table.groupby('Year', observed=True)))
+    return {year: groups.get(year, table.iloc[:0]) for year in years}
+
+
+# Shared by every session in the process like the tables it is built from
+@st.cache_resource
+def year_aggregates():
+    hospitalizations_by_state = load_data.dataset('hospitalizations_by_state')
+    # Every year that can be picked on the "Analysis by Year" slider
+    years = range(FIRST_YEAR, hospitalizations_by_state['Year'].max() + 1)
+    # Pre-compute the group-by results for each chart, keyed by (dataset, year, filter dimensions),
+    # so moving the year slider is a dictionary lookup instead of a scan of the full tables
+    aggregates = {}
+    for year, table in tables_by_year(hospitalizations_by_state, years).items():
+        aggregates[('hospitalizations_by_state', year)] = plots.state_counts(table)
+    for year, table in tables_by_year(load_data.dataset('problems_by_scale'), years).items():
+        aggregates[('problems_by_scale', year)] = plots.problem_counts(table)
+    for year, table in tables_by_year(load_data.dataset('outcomes_by_consumer_group'), years).items():
+        aggregates[('outcomes_by_consumer_group', year)] = plots.outcome_counts_by_group(table)
+    for year, table in tables_by_year(load_data.dataset('diagnoses_by_age_band'), years).items():
+        for setting, setting_table in table.groupby('Setting', observed=True):
+            aggregates[('diagnoses_by_age_band', year, setting)] = plots.diagnosis_counts_by_age_band(setting_table)
+    return MappingProxyType(aggregates)
+
+
+# Dense (age band x diagnosis x year) and (age band x year x sex) counts for the "Trends Over Time" tab, built once
+# per process so changing the age band or the diagnoses only slices the arrays
+@st.cache_resource
+def trend_counts():
+    diagnoses = load_data.dataset('diagnoses_by_age_band')
+    diagnoses = diagnoses[diagnoses['Principal diagnosis'] != ' ']
+    hospitalizations = load_data.dataset('hospitalizations_by_age')
+    # Hospitalisations and patients of females and males, leaving out the 0-11 age group
+    hospitalizations = hospitalizations[
+        (hospitalizations['Age group'] != '0–11 years')
+        & hospitalizations['Measure'].isin(['Hospitalisations', 'Patients'])
+        & hospitalizations['Sex'].isin(['Female', 'Male'])
+    ]
+    # Map the age groups onto the age bands used by the consumer outcomes data
+    age_bands = hospitalizations['Age group'].astype(object).replace(plots.AGE_BANDS)
+    return MappingProxyType({
+        'diagnoses_by_age_band': DenseCounts(diagnoses, ['Age band', 'Principal diagnosis', 'Year']),
+        'hospitalizations_by_age_band': DenseCounts(hospitalizations.assign(**{'Age band': age_bands}), ['Age band', 'Year', 'Sex']),
+    })
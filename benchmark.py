@@ -0,0 +1,200 @@
+"""Headless benchmarks for data loading and every chart in plots.py.
+
+Run with ``python benchmark.py`` (no Streamlit server needed). Results are written as JSON so that runs
+from different commits can be compared with ``python benchmark.py --compare old.json``.
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+import altair as alt
+import pandas as pd
+import streamlit as st
+import aggregates
+import load_data
+import plots
+import schema
+
+# Outside of `streamlit run` every cached call and widget logs a "no runtime" warning, which would bury the results
+st.get_option('logger.level')  # parse the config first, as that resets the log level
+st.logger.set_log_level('error')
+
+
+def measure(func, *args, repeat=5):
+    # Time the function over several runs, then measure its peak Python memory on one more run
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'min_s': min(timings),
+        'median_s': statistics.median(timings),
+        'peak_bytes': peak,
+    }
+
+
+def build_spec(func):
+    # Benchmark the uncached chart builder, including the Vega-Lite serialization the chart cache does on a miss
+    def build(*args):
+        chart = func.__wrapped__(*args)
+        return chart.to_json() if isinstance(chart, alt.TopLevelMixin) else chart
+    return build
+
+
+def pandas_reader(xls, sheet_name):
+    # clean_table with the reader it used before streaming was added, for comparison
+    reader, load_data.EXCEL_READER = load_data.EXCEL_READER, 'pandas'
+    try:
+        return load_data.clean_table(xls, sheet_name)
+    finally:
+        load_data.EXCEL_READER = reader
+
+
+def shared_dataset(name):
+    # The same dataset memory mapped from its shared Arrow file (written on the first call) instead of converted
+    store, load_data.DATASET_STORE = load_data.DATASET_STORE, 'shared'
+    try:
+        return load_data.dataset.__wrapped__(name)
+    finally:
+        load_data.DATASET_STORE = store
+
+
+def loading_cases():
+    for path, pattern in ((load_data.ADMITTED_PATIENTS_PATH, r'Table AC\.\d+'), (load_data.CONSUMER_OUTCOMES_PATH, r'Table NOCC\.\d+')):
+        xls = pd.ExcelFile(path)
+        for sheet_name in [sheet for sheet in xls.sheet_names if re.match(pattern, sheet)]:
+            yield 'clean_table', {'sheet': sheet_name}, load_data.clean_table, (xls, sheet_name)
+            yield 'clean_table_pandas_reader', {'sheet': sheet_name}, pandas_reader, (xls, sheet_name)
+    yield 'build_admitted_patients_data', {}, load_data.build_admitted_patients_data, (load_data.ADMITTED_PATIENTS_PATH,)
+    yield 'build_consumer_outcomes_data', {}, load_data.build_consumer_outcomes_data, (load_data.CONSUMER_OUTCOMES_PATH,)
+    # Reading the Feather cache is what every process after the first one pays (the loaders build it if needed)
+    load_data.admitted_patients_data()
+    load_data.consumer_outcomes_data()
+    for path in (load_data.ADMITTED_PATIENTS_PATH, load_data.CONSUMER_OUTCOMES_PATH):
+        yield 'read_cached_tables', {'workbook': os.path.basename(path)}, load_data.read_cached_tables, (load_data.cache_path(path),)
+    for name in schema.DATASETS:
+        yield 'dataset', {'dataset': name}, load_data.dataset.__wrapped__, (name,)
+        yield 'dataset_shared', {'dataset': name}, shared_dataset, (name,)
+    yield 'year_aggregates', {}, aggregates.year_aggregates.__wrapped__, ()
+    yield 'trend_counts', {}, aggregates.trend_counts.__wrapped__, ()
+
+
+def plot_cases(dataset, year_aggregates, trend_counts):
+    # Overview charts
+    for name, table in (
+        ('hospitalizations_by_state', dataset('hospitalizations_by_state')),
+        ('hospitalizations_by_age', dataset('hospitalizations_by_age')),
+        ('hospitalizations_by_socioeconomic_status', dataset('hospitalizations_by_demographic')),
+        ('hospitalizations_by_remoteness', dataset('hospitalizations_by_demographic')),
+        ('hospitalizations_by_indigenous_status', dataset('hospitalizations_by_demographic')),
+        ('diagnosis_age', dataset('diagnoses_by_age_band')),
+        ('admission_problems', dataset('problems_by_scale')),
+    ):
+        yield name, {}, build_spec(getattr(plots, name)), (table,)
+    # "Analysis by Year" charts for every year and filter value
+    for key, value in year_aggregates.items():
+        table_name, year = key[0], key[1]
+        if table_name == 'hospitalizations_by_state':
+            yield 'state_chart', {'year': year}, build_spec(plots.state_chart), (value,)
+        elif table_name == 'problems_by_scale':
+            yield 'problems_chart', {'year': year}, build_spec(plots.problems_chart), (value,)
+        elif table_name == 'outcomes_by_consumer_group':
+            for consumer_group, outcome_groups in value.items():
+                yield 'outcome_groups_chart', {'year': year, 'consumer_group': consumer_group}, build_spec(plots.outcome_groups_chart), (outcome_groups,)
+        elif table_name == 'diagnoses_by_age_band':
+            for age_band, diagnoses in value.items():
+                yield 'diagnosis_counts_chart', {'year': year, 'setting': key[2], 'age_band': age_band}, build_spec(plots.diagnosis_counts_chart), (diagnoses,)
+    # "Trends Over Time" charts for every age band
+    trends = trend_counts['diagnoses_by_age_band']
+    all_diagnoses = tuple(trends.values('Principal diagnosis'))
+    for age_band in trends.values('Age band'):
+        yield 'diagnosis_trends_chart', {'age_band': age_band}, build_spec(plots.diagnosis_trends_chart), (trends, age_band, all_diagnoses)
+        yield 'hospitalizations_by_age_sex_over_time', {'age_band': age_band}, build_spec(plots.hospitalizations_by_age_sex_over_time), (trend_counts['hospitalizations_by_age_band'], age_band)
+    # The functions with widgets (run in bare mode, so each widget returns its default)
+    yield 'outcomes_chart', {}, plots.outcomes_chart, (year_aggregates[('outcomes_by_consumer_group', aggregates.FIRST_YEAR)],)
+    yield 'hospitalizations_by_diagnosis_over_time', {}, plots.hospitalizations_by_diagnosis_over_time, (trends,)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_cases(group, cases, repeat):
+    results = []
+    for name, params, func, args in cases:
+        result = {'group': group, 'name': name, 'params': {key: str(value) for key, value in params.items()}}
+        result.update(measure(func, *args, repeat=repeat))
+        results.append(result)
+        print('{:<45} {:<60} {:>9.2f} ms {:>10.1f} KiB'.format(name, ', '.join('{}={}'.format(*item) for item in result['params'].items()), result['median_s'] * 1000, result['peak_bytes'] / 1024))
+    return results
+
+
+def run(repeat):
+    results = run_cases('loading', loading_cases(), repeat)
+    results += run_cases('plots', plot_cases(load_data.dataset, aggregates.year_aggregates(), aggregates.trend_counts()), repeat)
+    tables = {'admitted_patients': load_data.admitted_patients_data(), 'consumer_outcomes': load_data.consumer_outcomes_data()}
+    return {
+        'commit': git_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'altair': alt.__version__,
+        'streamlit': st.__version__,
+        'repeat': repeat,
+        'results': results,
+        'memory': {name: load_data.memory_report(dfs).to_dict(orient='records') for name, dfs in tables.items()},
+    }
+
+
+def result_key(result):
+    return (result['group'], result['name'], tuple(sorted(result['params'].items())))
+
+
+def compare(baseline, current):
+    # Print the ratio of each median timing against the baseline run (above 1 means slower)
+    before = {result_key(result): result for result in baseline['results']}
+    print('\nCompared with commit {} ({})'.format(baseline.get('commit'), baseline.get('timestamp')))
+    totals = {}
+    for result in current['results']:
+        old = before.get(result_key(result))
+        if old is None:
+            continue
+        total = totals.setdefault(result['name'], [0.0, 0.0])
+        total[0] += old['median_s']
+        total[1] += result['median_s']
+    for name, (old, new) in totals.items():
+        print('{:<45} {:>9.2f} ms -> {:>9.2f} ms  x{:.2f}'.format(name, old * 1000, new * 1000, new / old if old else float('nan')))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5, help='number of timed runs per case')
+    parser.add_argument('--output', default='benchmark-results.json', help='where to write the JSON results')
+    parser.add_argument('--compare', help='earlier JSON results to compare against')
+    args = parser.parse_args(argv)
+    report = run(args.repeat)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print('\nWrote {} results to {}'.format(len(report['results']), args.output))
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
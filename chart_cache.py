@@ -0,0 +1,85 @@
+import functools
+import json
+import os
+import threading
+from collections import OrderedDict
+import pandas as pd
+
+# Maximum number of chart specs kept per process before the least recently used ones are evicted
+CHART_CACHE_SIZE = int(os.environ.get('CHART_CACHE_SIZE', 256))
+
+
+class Identity:
+    # Tables are shared, read-only objects, so they are keyed by identity rather than by hashing their contents.
+    # Holding a reference keeps the id from being reused by another object while the entry is cached.
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __hash__(self):
+        return id(self.obj)
+
+    def __eq__(self, other):
+        return isinstance(other, Identity) and self.obj is other.obj
+
+
+class SpecCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.specs = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # Streamlit runs every session in its own thread, so access to the cache is serialised
+        self.lock = threading.Lock()
+
+    def get_or_build(self, key, build):
+        with self.lock:
+            if key in self.specs:
+                self.specs.move_to_end(key)
+                self.hits += 1
+                spec = self.specs[key]
+            else:
+                spec = None
+        if spec is None:
+            spec = build().to_json()
+            with self.lock:
+                self.misses += 1
+                self.specs[key] = spec
+                self.specs.move_to_end(key)
+                while len(self.specs) > self.maxsize:
+                    self.specs.popitem(last=False)
+        # Hand out a fresh dict each time, so callers can never modify the cached spec
+        return json.loads(spec)
+
+    def clear(self):
+        with self.lock:
+            self.specs.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+spec_cache = SpecCache(CHART_CACHE_SIZE)
+# Tracks whether the current thread is already building a cached chart
+building = threading.local()
+
+
+def cache_key(func, args):
+    # DataFrames are keyed by identity, everything else (filter values such as an age group) by value
+    return (func.__name__,) + tuple(Identity(arg) if isinstance(arg, pd.DataFrame) else arg for arg in args)
+
+
+def cached_spec(func):
+    # Memoize a chart building function, returning its Vega-Lite spec as a dict
+    @functools.wraps(func)
+    def wrapper(*args):
+        if getattr(building, 'active', False):
+            # Called from inside another cached chart, which caches the finished chart itself
+            return func(*args)
+
+        def build():
+            building.active = True
+            try:
+                return func(*args)
+            finally:
+                building.active = False
+        return spec_cache.get_or_build(cache_key(func, args), build)
+    return wrapper
@@ -0,0 +1,124 @@
+import functools
+import json
+import os
+import threading
+import time
+from collections.abc import Mapping
+import streamlit as st
+
+# Set DASHBOARD_PROFILE=1 (or open the app with ?profile=1) to show a timing breakdown of every rerun
+PROFILE_ENV = 'DASHBOARD_PROFILE'
+PROFILE_QUERY_PARAM = 'profile'
+# Optionally append every rerun's breakdown to this file as one JSON object per line
+PROFILE_LOG_ENV = 'DASHBOARD_PROFILE_LOG'
+
+# The functions timed in each module: what the app calls and the chart builders those call. Helpers are left alone,
+# as some of them run once per cell of a workbook and a timer on each call would swamp both the report and the load.
+ENTRY_POINTS = {
+    'ui': ['chart_card', 'chart'],
+    'load_data': ['dataset', 'admitted_patients_data', 'consumer_outcomes_data'],
+    'aggregates': ['year_aggregates', 'trend_counts'],
+    'plots': [
+        'hospitalizations_by_state', 'hospitalizations_by_age', 'hospitalizations_by_socioeconomic_status',
+        'hospitalizations_by_remoteness', 'hospitalizations_by_indigenous_status', 'diagnosis_age',
+        'state_chart', 'outcomes_chart', 'outcome_groups_chart', 'problems_chart', 'diagnoses_chart',
+        'diagnosis_counts_chart', 'hospitalizations_by_diagnosis_over_time', 'diagnosis_trends_chart',
+        'hospitalizations_by_age_sex_over_time', 'pick_own_variables', 'variables_chart',
+    ],
+}
+
+# Each Streamlit session runs its script in its own thread, so the active recorder is kept per thread
+current = threading.local()
+
+
+class Recorder:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.depth = 0
+        self.calls = []
+
+    def add(self, category, name, depth, seconds, payload_bytes):
+        self.calls.append({
+            'category': category,
+            'name': name,
+            'depth': depth,
+            'seconds': seconds,
+            'payload_bytes': payload_bytes,
+        })
+
+
+def payload_size(value):
+    # Approximate number of bytes a value holds (DataFrames) or sends to the browser (chart specs and text)
+    # - pandas is only imported once profiling is used, so the page can be drawn before it is loaded
+    import pandas as pd
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, Mapping):
+        if '$schema' in value:
+            return len(json.dumps(value, default=str))
+        return sum(payload_size(item) for item in value.values())
+    if isinstance(value, (tuple, list)):
+        return sum(payload_size(item) for item in value)
+    if isinstance(value, str):
+        return len(value.encode())
+    return 0
+
+
+def traced(func, category, measure_args=False):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        recorder = getattr(current, 'recorder', None)
+        if recorder is None:
+            return func(*args, **kwargs)
+        depth = recorder.depth
+        recorder.depth += 1
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            recorder.depth = depth
+        seconds = time.perf_counter() - start
+        # Renderers return nothing, so for them the payload is what they were given
+        recorder.add(category, func.__name__, depth, seconds, payload_size(args if measure_args else result))
+        return result
+    wrapper.traced = True
+    return wrapper
+
+
+def install(module, category, measure_args=False):
+    # Wrap the module's entry points (including Streamlit cached functions) with a timer.
+    # Modules stay imported between reruns, so each function is only wrapped once.
+    for name in ENTRY_POINTS[module.__name__]:
+        value = getattr(module, name)
+        if not getattr(value, 'traced', False):
+            setattr(module, name, traced(value, category, measure_args))
+
+
+def enabled():
+    return os.environ.get(PROFILE_ENV) == '1' or st.query_params.get(PROFILE_QUERY_PARAM) in ('1', 'true')
+
+
+def start_rerun():
+    current.recorder = Recorder() if enabled() else None
+
+
+def finish_rerun():
+    recorder = getattr(current, 'recorder', None)
+    current.recorder = None
+    if recorder is None:
+        return
+    import pandas as pd
+    total = time.perf_counter() - recorder.start
+    calls = pd.DataFrame(recorder.calls, columns=['category', 'name', 'depth', 'seconds', 'payload_bytes'])
+    with st.expander('Performance of this rerun ({:.0f} ms)'.format(total * 1000), expanded=True):
+        # Only top level calls are summed, since nested calls are already part of their caller's time
+        top_level = calls[calls['depth'] == 0]
+        summary = top_level.groupby('category')[['seconds', 'payload_bytes']].sum()
+        summary.loc['other (layout, widgets, Streamlit)'] = [total - top_level['seconds'].sum(), 0]
+        st.dataframe(summary.assign(ms=summary['seconds'] * 1000)[['ms', 'payload_bytes']], width='stretch')
+        calls['name'] = ['  ' * depth + name for depth, name in zip(calls['depth'], calls['name'])]
+        st.dataframe(calls.assign(ms=calls['seconds'] * 1000)[['category', 'name', 'ms', 'payload_bytes']], width='stretch', hide_index=True)
+    log_path = os.environ.get(PROFILE_LOG_ENV)
+    if log_path:
+        with open(log_path, 'a') as f:
+            f.write(json.dumps({'timestamp': time.time(), 'total_seconds': total, 'calls': recorder.calls}) + '\n')
@@ -1,37 +1,77 @@
 import streamlit as st
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import glob
+import hashlib
+import json
+import multiprocessing
+from itertools import islice
+import os
 import re
+import shutil
+import tempfile
+from types import MappingProxyType
+from concurrent.futures import ProcessPoolExecutor
+import schema
 
+# The newest release of each workbook in data/ is loaded (e.g. admitted-patients-2012-23.xlsx replaces admitted-patients-2012-22.xlsx)
+ADMITTED_PATIENTS_PATH = max(glob.glob('./data/admitted-patients-*.xlsx'), default='./data/admitted-patients-2012-22.xlsx')
+CONSUMER_OUTCOMES_PATH = max(glob.glob('./data/consumer-outcomes-*.xlsx'), default='./data/consumer-outcomes-2012-22.xlsx')
+# Cleaned tables are stored here as Feather files so new processes can skip parsing the workbooks
+CACHE_DIR = './data/.cache'
+# Bump this whenever clean_table or the loaders change what they return, so stale caches are rebuilt
+CLEANING_VERSION = 6
+# Number of worker processes used to clean sheets in parallel (1 loads serially, 0 uses every core)
+LOAD_WORKERS = int(os.environ.get('LOAD_WORKERS', 1))
+# How clean_table reads a sheet: 'streaming' filters the rows as openpyxl reads them, 'pandas' parses the whole sheet first
+EXCEL_READER = os.environ.get('EXCEL_READER', 'streaming')
+# Where the datasets are kept: 'process' gives every server process its own copy, 'shared' memory maps one read-only
+# copy on disk that every server process on the host shares
+DATASET_STORE = os.environ.get('DATASET_STORE', 'process')
+# Cell markers for missing values as defined in the General Information sheet of each workbook
+ROUNDED_TO_ZERO = "—"
+MISSING_VALUES = [
+    ". .",  # "Not applicable"
+    "n.a.",  # "Not available"
+    "n.p.",  # "Not published"
+    "nan",  # nan string
+    " "
+]
+# Rows containing any of these labels are aggregates of other rows and are dropped
+AGGREGATE_LABELS = ["Total", "Subtotal", "All", "People"]
+# Values openpyxl gives for cells with Excel errors, which pandas reads as missing
+ERROR_VALUES = ('#NULL!', '#DIV/0!', '#VALUE!', '#REF!', '#NAME?', '#NUM!', '#N/A')
 
-def load_css(file_name):
-    with open(file_name) as f:
-        st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
 
+def year_column(col):
+    # Since sometimes the years are separated with hyphens OR dashes, standardize the name first and then keep only the YYYY
+    col = re.sub(r'[-–]', '-', col)
+    return col.split('-')[0] if '-' in col else col
 
-def clean_table(xls, sheet_name):
+
+def sheet_years(xls, sheet_name):
+    # Read only the header row of a sheet to find which years it covers
+    columns = xls.parse(sheet_name=sheet_name, header=4, nrows=0).columns
+    return {int(col) for col in map(year_column, columns) if col.isdigit()}
+
+
+def clean_table(xls, sheet_name, years=None):
+    if EXCEL_READER == 'streaming':
+        return stream_table(xls, sheet_name, years)
     # This is used to prevent pandas from silently automatically downcasting data types
     pd.set_option('future.no_silent_downcasting', True)
     # Step 1: Read in the data and start at row 4, which are the column names
     df = xls.parse(sheet_name=sheet_name, header=4)
     # Step 2: Handle replacing missing values as defined in the General Information sheet
-    replacements = {
-        "—": 0,  # "Rounded to zero"
-        ". .": np.nan,  # "Not applicable"
-        "n.a.": np.nan,  # "Not available"
-        "n.p.": np.nan,  # "Not published"
-        "nan": np.nan,  # nan string
-        ' ': np.nan
-    }
-    df.replace(replacements, inplace=True)
-    # Step 3: Remove any rows where there exists the words Total | Subtotal | All
-    rows_to_drop = df.apply(lambda row: any(str(cell) == "Total" or str(cell) == "Subtotal" or str(cell) == "All" or str(cell) == "People" for cell in row), axis=1)
+    # - Both passes are whole-frame boolean masks rather than per-cell Python comparisons
+    df = df.mask(df.isin(MISSING_VALUES), np.nan).mask(df == ROUNDED_TO_ZERO, 0)
+    # Step 3: Remove any rows where there exists the words Total | Subtotal | All | People
+    rows_to_drop = df.isin(AGGREGATE_LABELS).any(axis=1)
     df = df[~rows_to_drop]
     # Step 4: Standardize Year Columns to extract only the YYYY
-    # - Since sometimes the years are separated with hyphens OR dashes, we need to standardize the names first
-    df.columns = [re.sub(r'[-–]', '-', col) for col in df.columns]
-    # - Then extract the years for the column name
-    df.columns = [col.split('-')[0] if '-' in col else col for col in df.columns]
+    df.columns = [year_column(col) for col in df.columns]
     # Step 5: Drop columns that start with "Average annual\n change" (specific for consumer-outcomes table)
     df = df.drop([col for col in df.columns if re.match(r"^Average.*annual.*change", col, re.DOTALL)], axis=1)
     # Step 6: Drop any rows where all the year columns are empty
@@ -42,42 +82,421 @@ def clean_table(xls, sheet_name):
     df.rename(columns={"State\nTerritory": "State", "State/Territory": "State", "Count": "Count_Desc"}, inplace=True)
     # Step 7: Melt the DataFrame
     id_vars = [col for col in df.columns if col not in year_columns]
-    df_melted = pd.melt(df, id_vars=id_vars, value_vars=year_columns, var_name='Year', value_name='Count')
+    # - When only some years are requested (see ingest_workbook), the other year columns are left out
+    value_vars = year_columns if years is None else [col for col in year_columns if int(col) in years]
+    df_melted = pd.melt(df, id_vars=id_vars, value_vars=value_vars, var_name='Year', value_name='Count')
     # Step 8: Convert Year from string to int
     df_melted['Year'] = df_melted['Year'].astype(int)
+    # Step 9: Convert Count to a numeric column (blank cells such as '\xa0' become NaN) so it can be stored in columnar form
+    df_melted['Count'] = pd.to_numeric(df_melted['Count'], errors='coerce')
     return df_melted
 
 
-@st.cache_data
+def cell_kind(value):
+    # How pandas would type a cell when inferring the dtype of its column (empty and error cells are missing)
+    if value is None or value == '' or value == 'nan' or value in ERROR_VALUES:
+        return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float if isinstance(value, float) and not value.is_integer() else int
+    return object
+
+
+def cell_value(value, kind):
+    # Step 2 of clean_table for a single cell: missing values become NaN and values rounded to zero become 0
+    if kind is None or value in MISSING_VALUES:
+        return np.nan
+    if value == ROUNDED_TO_ZERO:
+        return 0
+    # Whole numbers are read as integers, like pandas does
+    return int(value) if kind is int else value
+
+
+def row_width(row):
+    # Number of cells up to the last non-empty one
+    width = len(row)
+    while width and row[width - 1] is None:
+        width -= 1
+    return width
+
+
+def column_dtype(kinds):
+    # Any text makes a column object, missing cells make whole numbers float
+    if object in kinds:
+        return object
+    if kinds == {int}:
+        return np.int64
+    return np.float64
+
+
+def stream_table(xls, sheet_name, years=None):
+    # Same result as clean_table, but the rows are cleaned one at a time as openpyxl streams them (in read-only,
+    # values-only mode), so aggregate and empty rows are dropped before any DataFrame is built
+    sheet = xls.book[sheet_name]
+    sheet.reset_dimensions()
+    rows = sheet.iter_rows(values_only=True)
+    # Step 1: Skip the four rows above the column names (missing cells are padded to the widest row at the end)
+    width = max([row_width(row) for row in islice(rows, 4)], default=0)
+    header = list(next(rows, ()))
+    header = header[:row_width(header)]
+    width = max(width, len(header))
+    data = []
+    kinds = []
+    for row in rows:
+        row = row[:row_width(row)]
+        width = max(width, len(row))
+        row_kinds = [cell_kind(value) for value in row]
+        # Column dtypes are inferred from every row of the sheet, including the ones dropped below
+        kinds.extend(set() for _ in range(len(row_kinds) - len(kinds)))
+        for column_kinds, kind in zip(kinds, row_kinds):
+            column_kinds.add(kind)
+        # Step 3: Skip any rows where there exists the words Total | Subtotal | All | People
+        if any(value in AGGREGATE_LABELS for value in row if isinstance(value, str)):
+            continue
+        data.append([cell_value(value, kind) for value, kind in zip(row, row_kinds)])
+    # Name the columns like pandas does: empty names become "Unnamed: i" and repeated names get a ".n" suffix
+    header += [None] * (width - len(header))
+    columns = []
+    repeats = {}
+    for i, col in enumerate(header):
+        col = 'Unnamed: {}'.format(i) if col is None or col == '' else col
+        repeats[col] = repeats.get(col, -1) + 1
+        columns.append('{}.{}'.format(col, repeats[col]) if repeats[col] else col)
+    kinds.extend(set() for _ in range(width - len(kinds)))
+    # Step 4: Standardize Year Columns to extract only the YYYY
+    columns = [year_column(col) for col in columns]
+    # Step 5: Drop columns that start with "Average annual\n change" (specific for consumer-outcomes table)
+    keep = [i for i, col in enumerate(columns) if not re.match(r"^Average.*annual.*change", col, re.DOTALL)]
+    year_index = [i for i in keep if columns[i].isdigit()]
+    id_index = [i for i in keep if not columns[i].isdigit()]
+    # Step 6: Drop any rows where all the year columns are empty
+    data = [row + [np.nan] * (width - len(row)) for row in data]
+    data = [row for row in data if not all(pd.isna(row[i]) for i in year_index)]
+    # Rename any generic columns
+    renames = {"State\nTerritory": "State", "State/Territory": "State", "Count": "Count_Desc"}
+    # Step 7: Build the long format directly, with every (id columns, year) pair in the same order pd.melt uses
+    if years is not None:
+        year_index = [i for i in year_index if int(columns[i]) in years]
+    ids = pd.DataFrame({
+        renames.get(columns[i], columns[i]): pd.Series([row[i] for row in data], dtype=column_dtype(kinds[i]))
+        for i in id_index
+    })
+    df_long = ids.iloc[np.tile(np.arange(len(data)), len(year_index))].reset_index(drop=True)
+    # Step 8: Year as an int
+    df_long['Year'] = np.repeat(np.array([int(columns[i]) for i in year_index], dtype=np.int64), len(data))
+    # Step 9: Convert Count to a numeric column (blank cells such as '\xa0' become NaN)
+    # - Numeric year columns give Count the dtype pd.melt would (a float column makes it float, even when the rows
+    #   kept only hold whole numbers), and any text in them leaves it to pd.to_numeric
+    counts = pd.Series([row[i] for i in year_index for row in data], dtype=object)
+    dtypes = [column_dtype(kinds[i]) for i in year_index]
+    df_long['Count'] = counts.astype(np.result_type(*dtypes)) if dtypes and object not in dtypes else pd.to_numeric(counts, errors='coerce')
+    return df_long
+
+
+def compact_table(df):
+    # Store every dimension column (State, Measure, Age group, ...) as a categorical with sorted categories,
+    # so repeated labels are held once per table rather than once per Year row
+    dimensions = [col for col in df.columns if df[col].dtype == object]
+    df = df.astype({col: pd.CategoricalDtype(sorted(df[col].dropna().unique())) for col in dimensions})
+    # Years fit comfortably in a small integer
+    df['Year'] = df['Year'].astype(np.int16)
+    # Counts are floats, as in the datasets (see schema.py). Whether pandas reads them as integers depends on the other
+    # year columns of the sheet, so this also keeps a table appended a year at a time the same as one built at once.
+    df['Count'] = df['Count'].astype(np.float64)
+    return df
+
+
+def memory_report(dfs):
+    # Compare the memory used by each compact table with the same table using plain object/int64 columns
+    rows = []
+    for name, df in dfs.items():
+        expanded = df.astype({col: object for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)})
+        expanded['Year'] = expanded['Year'].astype(np.int64)
+        bytes_before = int(expanded.memory_usage(deep=True).sum())
+        bytes_after = int(df.memory_usage(deep=True).sum())
+        rows.append({'Table': name, 'Bytes before': bytes_before, 'Bytes after': bytes_after, 'Bytes saved': bytes_before - bytes_after})
+    return pd.DataFrame(rows)
+
+
+def clean_sheets(path, sheets, years=None):
+    # Each worker opens its own copy of the workbook and cleans one chunk of the sheets
+    xls = pd.ExcelFile(path)
+    return [clean_table(xls, sheet_name, None if years is None else years[sheet_name]) for sheet_name in sheets]
+
+
+def load_workers(workers=None):
+    # Never start more workers than there are cores, so single core hosts always load serially
+    workers = LOAD_WORKERS if workers is None else workers
+    cores = os.cpu_count() or 1
+    return cores if workers == 0 else max(1, min(workers, cores))
+
+
+def clean_workbook(path, sheets, years=None, workers=None):
+    workers = min(load_workers(workers), len(sheets))
+    if workers <= 1:
+        return clean_sheets(path, sheets, years)
+    # Split the sheets into one interleaved chunk per worker, so the workbook is only opened once per process
+    chunks = [sheets[i::workers] for i in range(workers)]
+    # Use spawn rather than fork, since forking the multi-threaded Streamlit server is unsafe
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        results = list(pool.map(clean_sheets, [path] * workers, chunks, [years] * workers))
+    # Put the cleaned sheets back into their original order
+    cleaned = {}
+    for chunk, dfs in zip(chunks, results):
+        cleaned.update(zip(chunk, dfs))
+    return [cleaned[sheet_name] for sheet_name in sheets]
+
+
+def workbook_hash(path):
+    # Hash the contents of the workbook so any change to the file invalidates its cache
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def dataset_name(path):
+    # Every release of a workbook belongs to the same dataset (admitted-patients-2012-22.xlsx -> admitted-patients)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return re.sub(r'-\d{4}-\d{2}$', '', stem)
+
+
+def cache_path(path):
+    # The cache directory is keyed by dataset, workbook content hash and cleaning version
+    return os.path.join(CACHE_DIR, '{}-{}-v{}'.format(dataset_name(path), workbook_hash(path)[:16], CLEANING_VERSION))
+
+
+def previous_cache(path):
+    # Find the cache of an earlier release of the same dataset, built with the current cleaning version
+    prefix = dataset_name(path) + '-'
+    suffix = '-v{}'.format(CLEANING_VERSION)
+    candidates = [
+        os.path.join(CACHE_DIR, entry) for entry in os.listdir(CACHE_DIR)
+        if entry.startswith(prefix) and entry.endswith(suffix) and os.path.isfile(os.path.join(CACHE_DIR, entry, 'manifest.json'))
+    ] if os.path.isdir(CACHE_DIR) else []
+    return max(candidates, key=os.path.getmtime, default=None)
+
+
+def read_cached_table(directory, name):
+    # Memory map the Feather file rather than reading it into a separate buffer
+    return feather.read_table(os.path.join(directory, '{}.feather'.format(name)), memory_map=True).to_pandas()
+
+
+def read_cached_tables(directory):
+    tables = {}
+    for file_name in sorted(os.listdir(directory)):
+        if file_name.endswith('.feather'):
+            name = file_name[:-len('.feather')]
+            tables[name] = read_cached_table(directory, name)
+    # Keep the tables in their original sheet order (Table 1, Table 2, ..., Table 10)
+    return dict(sorted(tables.items(), key=lambda item: int(item[0].split()[-1])))
+
+
+def read_manifest(directory):
+    with open(os.path.join(directory, 'manifest.json')) as f:
+        return json.load(f)
+
+
+def write_cached_tables(dfs, manifest, directory):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    # Write into a temporary directory first and then move it into place, so concurrent
+    # processes never read a half written cache
+    tmp_dir = tempfile.mkdtemp(dir=CACHE_DIR)
+    for name, df in dfs.items():
+        feather.write_feather(df.reset_index(drop=True), os.path.join(tmp_dir, '{}.feather'.format(name)), compression='uncompressed')
+    with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    try:
+        os.rename(tmp_dir, directory)
+    except OSError:
+        # Another process has already published this cache
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    # Remove caches built from older releases or versions of the same dataset
+    prefix = os.path.basename(directory).rsplit('-', 2)[0] + '-'
+    for entry in os.listdir(CACHE_DIR):
+        stale = os.path.join(CACHE_DIR, entry)
+        if entry.startswith(prefix) and stale != directory and not entry.startswith('tmp'):
+            shutil.rmtree(stale, ignore_errors=True)
+
+
+def shared_dataset_path(directory, name):
+    # Stored next to the tables it is conformed from, and keyed by its entry in schema.py so a change there writes a new file
+    spec = json.dumps([schema.DATASETS[name], {col: np.dtype(dtype).name for col, dtype in schema.MEASURES.items()}], sort_keys=True)
+    return os.path.join(directory, '{}-{}.arrow'.format(name, hashlib.sha256(spec.encode()).hexdigest()[:8]))
+
+
+def arrow_table(df):
+    # Keep NaN as a float value rather than turning it into an Arrow null, as nulls would have to be filled in
+    # (and the column copied) when the table is converted back to pandas
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    for i, col in enumerate(df.columns):
+        if df[col].dtype.kind == 'f':
+            table = table.set_column(i, col, pa.array(df[col].to_numpy(), from_pandas=False))
+    return table
+
+
+def write_shared_dataset(df, path):
+    # Write to a temporary file and then link it into place. Linking fails if the file already exists, so the first
+    # process to finish publishes it and a file other processes have mapped is never replaced.
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    os.close(fd)
+    try:
+        feather.write_feather(arrow_table(df), tmp_path, compression='uncompressed')
+        os.link(tmp_path, path)
+    except FileExistsError:
+        pass
+    finally:
+        os.remove(tmp_path)
+
+
+def shared_dataset(directory, name, table_name):
+    # The first process to load a dataset stores it conformed, in the uncompressed Arrow IPC (Feather V2) format.
+    # Every process then memory maps the file: the columns of the DataFrame are read-only views of the mapped file
+    # (split_blocks stops pandas from consolidating them into new arrays), so the operating system keeps one copy
+    # in memory for all processes, and none of them has to parse or convert the table.
+    path = shared_dataset_path(directory, name)
+    if not os.path.isfile(path):
+        write_shared_dataset(schema.conform(name, read_cached_table(directory, table_name)), path)
+    return feather.read_table(path, memory_map=True).to_pandas(split_blocks=True)
+
+
+def cached_directory(path, build):
+    # Build the cleaned tables once per workbook version and reuse them from the on-disk cache afterwards.
+    # A new release is built on top of the cache of the previous one, so only its new years are cleaned.
+    directory = cache_path(path)
+    if not os.path.isdir(directory):
+        previous = previous_cache(path)
+        store = (read_cached_tables(previous), read_manifest(previous)) if previous else None
+        write_cached_tables(*build(path, store), directory)
+    return directory
+
+
+def cached_tables(path, build):
+    return read_cached_tables(cached_directory(path, build))
+
+
+def read_only(df):
+    # The same table with every column a view of an Arrow buffer, which numpy marks as read-only, so writing to it
+    # in place raises an error instead of changing the table for every session
+    return arrow_table(df).to_pandas(split_blocks=True)
+
+
+# The tables are loaded once per process and shared by every session without being copied on each rerun,
+# so they are returned as a read-only mapping of read-only tables
+@st.cache_resource
 def admitted_patients_data():
-    # Load the data
-    xls = pd.ExcelFile('./data/admitted-patients-2012-22.xlsx')
-    # Pull in all the sheets that start with Table AC
-    sheets = [sheet for sheet in xls.sheet_names if re.match(r'Table AC\.\d+', sheet)]
-    # Clean the data for each sheet
-    dfs = {'Table {}'.format(i + 1): clean_table(xls, sheet_name) for i, sheet_name in enumerate(sheets)}
-    # For Table AC.6 remove the rows with an aggregate total for the Financial Year
-    dfs['Table 6'] = dfs['Table 6'][~dfs['Table 6']['Quarter'].str.contains("Financial Year", na=False)]
-    # For Table AC.6 map the quarters to numerical representations
-    unique_quarters = dfs['Table 6']['Quarter'].unique()
-    quarter_mapping = {quarter: i for i, quarter in enumerate(unique_quarters, start=1)}
-    dfs['Table 6']['Quarter'] = dfs['Table 6']['Quarter'].map(quarter_mapping)
-    # For Table AC.3 we need to remove redundant age groups (85 and older and 85 and over are the same group)
-    dfs['Table 3']['Age group'] = dfs['Table 3']['Age group'].replace('85 years and over', '85 years and older')
-    # For Table AC.5, rename quantiles 1 and 5 to ensure similar formatting
-    dfs['Table 5']['Demographic'] = dfs['Table 5']['Demographic'].replace('Quintile 1 (most disadvantaged)', 'Quintile 1')
-    dfs['Table 5']['Demographic'] = dfs['Table 5']['Demographic'].replace('Quintile 5 (least disadvantaged)', 'Quintile 5')
-    return dfs
+    return MappingProxyType({name: read_only(df) for name, df in cached_tables(ADMITTED_PATIENTS_PATH, build_admitted_patients_data).items()})
 
 
-@st.cache_data
+@st.cache_resource
 def consumer_outcomes_data():
-    # Load the data
-    xls = pd.ExcelFile('./data/consumer-outcomes-2012-22.xlsx')
-    # Pull in all the sheets that start with Table NOCC
-    sheets = [sheet for sheet in xls.sheet_names if re.match(r'Table NOCC\.\d+', sheet)]
-    # Clean the data for each sheet
-    dfs = {'Table {}'.format(i + 1): clean_table(xls, sheet_name) for i, sheet_name in enumerate(sheets)}
-    # For table 12, remove the numbers in the HoNOSCA column
-    dfs['Table 8']['HoNOSCA scale'] = dfs['Table 8']['HoNOSCA scale'].str.replace(r'^\d+\.\s*', '', regex=True)
+    return MappingProxyType({name: read_only(df) for name, df in cached_tables(CONSUMER_OUTCOMES_PATH, build_consumer_outcomes_data).items()})
+
+
+def workbook(name):
+    # Path and builder of each workbook the datasets in schema.py are cleaned from
+    return {
+        'admitted-patients': (ADMITTED_PATIENTS_PATH, build_admitted_patients_data),
+        'consumer-outcomes': (CONSUMER_OUTCOMES_PATH, build_consumer_outcomes_data),
+    }[name]
+
+
+# Each dataset is loaded on its own the first time it is used, so a process only reads the tables it needs.
+# Like the tables of the workbooks, it is shared by every session and read-only.
+@st.cache_resource
+def dataset(name):
+    spec = schema.DATASETS[name]
+    directory = cached_directory(*workbook(spec['workbook']))
+    tables = read_manifest(directory)['tables']
+    if spec['sheet'] not in tables:
+        raise KeyError('{} is cleaned from {}, which is not in {}'.format(name, spec['sheet'], os.path.basename(workbook(spec['workbook'])[0])))
+    if DATASET_STORE == 'shared':
+        return shared_dataset(directory, name, tables[spec['sheet']])
+    return read_only(schema.conform(name, read_cached_table(directory, tables[spec['sheet']])))
+
+
+def ingest_workbook(path, pattern, fix, store=None):
+    # Clean the sheets of a workbook that match the pattern into Table 1, Table 2, ... and record what was
+    # ingested in a manifest. Given the tables and manifest of an earlier release (store), only the years
+    # the earlier release doesn't have are cleaned and appended to its tables.
+    xls = pd.ExcelFile(path)
+    sheets = [sheet for sheet in xls.sheet_names if re.match(pattern, sheet)]
+    if store is not None:
+        tables, manifest = dict(store[0]), store[1]
+        years = {sheet: sheet_years(xls, sheet) - set(manifest['years'].get(manifest['tables'].get(sheet), [])) for sheet in sheets}
+        # A workbook without any new years is a revision of the same release, so it is rebuilt from scratch
+        if not any(years.values()):
+            store = None
+    if store is None:
+        tables, manifest = {}, {'tables': {}, 'years': {}, 'quarters': {}, 'sources': []}
+        years = {sheet: None for sheet in sheets}
+    manifest['cleaning_version'] = CLEANING_VERSION
+    manifest['sources'].append({'workbook': os.path.basename(path), 'sha256': workbook_hash(path)})
+    # Sheets keep the Table N name they had in earlier releases, and new sheets are numbered after them
+    for sheet in sheets:
+        manifest['tables'].setdefault(sheet, 'Table {}'.format(len(manifest['tables']) + 1))
+    # Clean the sheets that have new years (in parallel when LOAD_WORKERS is set)
+    sheets = [sheet for sheet in sheets if years[sheet] is None or years[sheet]]
+    dfs = {manifest['tables'][sheet]: df for sheet, df in zip(sheets, clean_workbook(path, sheets, years))}
+    for name, df in dfs.items():
+        manifest['years'][name] = sorted(set(manifest['years'].get(name, [])) | set(df['Year'].unique().tolist()))
+    # Append the new rows to the tables of the earlier release (Year stays the slowest changing column)
+    for name, df in fix(dfs, manifest).items():
+        if name in tables:
+            df = append_years(tables[name], df)
+        tables[name] = compact_table(df)
+    return dict(sorted(tables.items(), key=lambda item: int(item[0].split()[-1]))), manifest
+
+
+def append_years(table, df):
+    # Append the rows of new years to a table so it is the same as a full rebuild of the new release.
+    # - clean_table drops rows without a count in any year, so a row that only has counts from a new year on is
+    #   missing from the earlier release, and is added with an empty count for each earlier year.
+    # - A full rebuild lists the rows of every year in sheet order, which is the order of the new years' rows.
+    ids = [col for col in df.columns if col not in ('Year', 'Count')]
+    table = table.astype({col: object for col in ids if isinstance(table[col].dtype, pd.CategoricalDtype)})
+    rows = df[ids].drop_duplicates(ignore_index=True)
+    missing = rows.merge(table[ids].drop_duplicates(), how='left', indicator=True)
+    missing = missing[missing.pop('_merge') == 'left_only']
+    missing = missing.merge(pd.DataFrame({'Year': sorted(table['Year'].unique())}), how='cross').assign(Count=np.nan)[df.columns]
+    # Empty parts are left out, as concat would still turn integer counts into floats for them
+    df = pd.concat([part for part in (table, missing, df) if len(part)], ignore_index=True)
+    df = df.merge(rows.assign(Row=np.arange(len(rows))), how='left', on=ids)
+    return df.sort_values(['Year', 'Row'], kind='stable', ignore_index=True).drop(columns='Row')
+
+
+def fix_admitted_patients_tables(dfs, manifest):
+    if 'Table 6' in dfs:
+        # For Table AC.6 remove the rows with an aggregate total for the Financial Year
+        dfs['Table 6'] = dfs['Table 6'][~dfs['Table 6']['Quarter'].str.contains("Financial Year", na=False)]
+        # For Table AC.6 map the quarters to numerical representations
+        # - The mapping is kept in the manifest, so quarters keep their numbers when later years are appended
+        quarter_mapping = manifest['quarters']
+        for quarter in dfs['Table 6']['Quarter'].unique():
+            quarter_mapping.setdefault(quarter, len(quarter_mapping) + 1)
+        dfs['Table 6']['Quarter'] = dfs['Table 6']['Quarter'].map(quarter_mapping)
+    if 'Table 3' in dfs:
+        # For Table AC.3 we need to remove redundant age groups (85 and older and 85 and over are the same group)
+        dfs['Table 3']['Age group'] = dfs['Table 3']['Age group'].replace('85 years and over', '85 years and older')
+    if 'Table 5' in dfs:
+        # For Table AC.5, rename quantiles 1 and 5 to ensure similar formatting
+        dfs['Table 5']['Demographic'] = dfs['Table 5']['Demographic'].replace('Quintile 1 (most disadvantaged)', 'Quintile 1')
+        dfs['Table 5']['Demographic'] = dfs['Table 5']['Demographic'].replace('Quintile 5 (least disadvantaged)', 'Quintile 5')
     return dfs
+
+
+def fix_consumer_outcomes_tables(dfs, manifest):
+    if 'Table 8' in dfs:
+        # For table 12, remove the numbers in the HoNOSCA column
+        dfs['Table 8']['HoNOSCA scale'] = dfs['Table 8']['HoNOSCA scale'].str.replace(r'^\d+\.\s*', '', regex=True)
+    return dfs
+
+
+def build_admitted_patients_data(path, store=None):
+    # Pull in all the sheets that start with Table AC
+    return ingest_workbook(path, r'Table AC\.\d+', fix_admitted_patients_tables, store)
+
+
+def build_consumer_outcomes_data(path, store=None):
+    # Pull in all the sheets that start with Table NOCC
+    return ingest_workbook(path, r'Table NOCC\.\d+', fix_consumer_outcomes_tables, store)
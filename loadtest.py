@@ -0,0 +1,220 @@
+"""Load test for streamlit_app.py with many concurrent sessions.
+
+Run with ``python loadtest.py --sessions 50`` (no Streamlit server needed). Every session is driven through
+Streamlit's AppTest in its own thread of this process, the way a Streamlit server runs each session's script in
+its own thread. Each session opens the app and then plays a random but realistic script of tab switches, year
+slider moves and selectbox/multiselect changes. The sessions start together, and the report gives the rerun
+latency (p50/p95) for each kind of interaction, the throughput of the process and its memory use (RSS).
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import resource
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime, timezone
+import streamlit as st
+from streamlit import config
+from streamlit.runtime.runtime import Runtime
+from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+from streamlit.testing.v1 import AppTest, app_test, local_script_runner
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'streamlit_app.py')
+TABS = ["Overview", "Analysis by Year", "Trends Over Time"]
+
+# Outside of `streamlit run` every cached call and widget logs a "no runtime" warning, which would bury the results
+st.get_option('logger.level')  # parse the config first, as that resets the log level
+st.logger.set_log_level('error')
+
+
+def share_server_state():
+    # AppTest is written for one app run at a time: every run sets up (and afterwards removes) its own mock Runtime,
+    # script cache and config overrides, which breaks the runs of the other sessions that are still going.
+    # Share them between the sessions instead, the way every session of a real server shares one of each.
+    latest = []
+
+    def current(cls):
+        if cls._instance is not None:
+            latest[:] = [cls._instance]
+        return cls._instance if cls._instance is not None else next(iter(latest), None)
+
+    def instance(cls):
+        runtime = current(cls)
+        if runtime is None:
+            raise RuntimeError("Runtime hasn't been created!")
+        return runtime
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: current(cls) is not None)
+    # Runs that end restore the config of the runs that started before them, so set the option every run needs up front
+    config.set_option('global.appTest', True)
+    # One script cache, so the app is compiled once rather than on every rerun of every session. Compile it before
+    # the sessions start, as parsing in several threads at once can fail with a SystemError on Python 3.11.
+    script_cache = ScriptCache()
+    script_cache.get_bytecode(APP_PATH)
+    app_test.ScriptCache = local_script_runner.ScriptCache = lambda: script_cache
+
+
+def rss_bytes():
+    # Current resident set size of this process (Linux), or the peak where the current value isn't available
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return peak_rss_bytes()
+
+
+def peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def widget(widgets, label):
+    return next((item for item in widgets if item.label == label), None)
+
+
+def next_action(at, rng):
+    # Pick an interaction that is possible on the open tab, weighted towards the widgets people use most
+    tab = at.session_state['active_tab'] if 'active_tab' in at.session_state else TABS[0]
+    actions = [('switch tab', 1)]
+    if tab == "Analysis by Year":
+        actions += [('move year slider', 4), ('change consumer group', 2), ('change age band', 2)]
+    elif tab == "Trends Over Time":
+        actions += [('change ages', 2), ('change diagnoses', 2)]
+    names, weights = zip(*actions)
+    return rng.choices(names, weights)[0], tab
+
+
+def interact(at, action, tab, rng):
+    # Set up the widget change (or tab switch) that the next rerun applies
+    if action == 'switch tab':
+        at.session_state['active_tab'] = rng.choice([name for name in TABS if name != tab])
+    elif action == 'move year slider':
+        slider = at.slider(key='year')
+        slider.set_value(rng.randint(int(slider.min), int(slider.max)))
+    elif action in ('change consumer group', 'change age band', 'change ages'):
+        label = {'change consumer group': 'Consumer group', 'change age band': 'Age band', 'change ages': 'Ages'}[action]
+        selectbox = widget(at.selectbox, label)
+        selectbox.select(rng.choice(selectbox.options))
+    elif action == 'change diagnoses':
+        multiselect = widget(at.multiselect, 'Diagnoses')
+        multiselect.set_value(rng.sample(multiselect.options, rng.randint(1, min(4, len(multiselect.options)))))
+
+
+def run_session(index, steps, seed, think, timeout, start, results):
+    rng = random.Random(seed * 100003 + index)
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    start.wait()
+    action, tab = 'open app', None
+    try:
+        for step in range(steps + 1):
+            if step:
+                action, tab = next_action(at, rng)
+                interact(at, action, tab, rng)
+            began = time.perf_counter()
+            at.run()
+            results.append({'session': index, 'action': action, 'seconds': time.perf_counter() - began, 'error': bool(at.exception)})
+            if think:
+                time.sleep(rng.uniform(0, think))
+    except Exception:
+        results.append({'session': index, 'action': action, 'seconds': None, 'error': True, 'traceback': traceback.format_exc()})
+
+
+def percentile(values, q):
+    # Nearest-rank percentile
+    values = sorted(values)
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)] if values else None
+
+
+def summarise(records):
+    seconds = [record['seconds'] for record in records if record['seconds'] is not None]
+    return {
+        'reruns': len(seconds),
+        'errors': sum(record['error'] for record in records),
+        'p50_ms': percentile(seconds, 50) * 1000 if seconds else None,
+        'p95_ms': percentile(seconds, 95) * 1000 if seconds else None,
+        'max_ms': max(seconds) * 1000 if seconds else None,
+    }
+
+
+def run(sessions, steps, seed, think, timeout):
+    share_server_state()
+    rss_start = rss_bytes()
+    results = []
+    start = threading.Barrier(sessions + 1)
+    threads = [
+        threading.Thread(target=run_session, args=(i, steps, seed, think, timeout, start, results), name='session-{}'.format(i))
+        for i in range(sessions)
+    ]
+    for thread in threads:
+        thread.start()
+    # Sample the memory of the process while the sessions are running
+    start.wait()
+    began = time.perf_counter()
+    rss_samples = []
+    while any(thread.is_alive() for thread in threads):
+        rss_samples.append(rss_bytes())
+        time.sleep(0.1)
+    wall = time.perf_counter() - began
+    actions = {}
+    for record in results:
+        actions.setdefault(record['action'], []).append(record)
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'streamlit': st.__version__,
+        'cpus': os.cpu_count(),
+        'sessions': sessions,
+        'steps': steps,
+        'seed': seed,
+        'think_s': think,
+        'wall_s': wall,
+        'throughput_reruns_per_s': sum(record['seconds'] is not None for record in results) / wall if wall else None,
+        'overall': summarise(results),
+        'actions': {name: summarise(records) for name, records in sorted(actions.items())},
+        'rss': {
+            'start_bytes': rss_start,
+            'max_bytes': max(rss_samples, default=rss_start),
+            'end_bytes': rss_bytes(),
+            'peak_bytes': peak_rss_bytes(),
+        },
+        'failures': [record['traceback'] for record in results if 'traceback' in record][:5],
+    }
+
+
+def print_report(report):
+    print('{} sessions x {} interactions in {:.1f} s: {:.1f} reruns/s'.format(report['sessions'], report['steps'], report['wall_s'], report['throughput_reruns_per_s']))
+    print('{:<25} {:>7} {:>7} {:>10} {:>10} {:>10}'.format('action', 'reruns', 'errors', 'p50 ms', 'p95 ms', 'max ms'))
+    for name, summary in list(report['actions'].items()) + [('overall', report['overall'])]:
+        print('{:<25} {:>7} {:>7} {:>10.1f} {:>10.1f} {:>10.1f}'.format(name, summary['reruns'], summary['errors'], summary['p50_ms'] or 0, summary['p95_ms'] or 0, summary['max_ms'] or 0))
+    rss = report['rss']
+    print('RSS: {:.0f} MiB at start, {:.0f} MiB max while running, {:.0f} MiB at the end'.format(rss['start_bytes'] / 2 ** 20, rss['max_bytes'] / 2 ** 20, rss['end_bytes'] / 2 ** 20))
+    for failure in report['failures']:
+        print(failure)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=10, help='number of concurrent sessions')
+    parser.add_argument('--steps', type=int, default=20, help='interactions per session after opening the app')
+    parser.add_argument('--seed', type=int, default=0, help='seed for the interaction scripts')
+    parser.add_argument('--think', type=float, default=0.0, help='maximum pause in seconds between interactions')
+    parser.add_argument('--timeout', type=float, default=300.0, help='seconds a single rerun may take')
+    parser.add_argument('--output', default='loadtest-results.json', help='where to write the JSON results')
+    args = parser.parse_args(argv)
+    report = run(args.sessions, args.steps, args.seed, args.think, args.timeout)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print_report(report)
+    print('\nWrote the results to {}'.format(args.output))
+    return 1 if report['overall']['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
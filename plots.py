@@ -1,11 +1,45 @@
 import altair as alt
+import pandas as pd
 import streamlit as st
+import reduction
+from chart_cache import cached_spec
+
+# Shown when a filter leaves nothing to plot (shared so the empty chart is cached once)
+NO_OUTCOMES = pd.DataFrame({'Outcome group': [], 'Count': []})
+NO_DIAGNOSES = pd.DataFrame({'Principal diagnosis': [], 'Count': []})
+# Diagnoses shown on the "Trends Over Time" tab until others are picked
+DEFAULT_DIAGNOSES = ['(F32) Depressive episode', '(F99) Mental disorder not otherwise specified']
+# Age groups of the admitted patients data mapped onto the age bands used by the consumer outcomes data
+AGE_BANDS = {
+    #rename age group 12-17 to 11-17
+    '12–17 years': '11-17 years',
+    #rename age group 18-24 to 18-64 and do the same for other age groups
+    '18–24 years': '18-64 years',
+    '25–34 years': '18-64 years',
+    '35–44 years': '18-64 years',
+    '45–54 years': '18-64 years',
+    '55–64 years': '18-64 years',
+    #rename other ages to 65 years and over
+    '65–74 years': '65 years and over',
+    '75–84 years': '65 years and over',
+    '85 years and over': '65 years and over',
+    '85 years and older': '65 years and over'
+}
 
 
-def hospitalizations_by_state(table):
+def state_counts(table):
     df_hospitalizations = table[table['Measure'] == 'Hospitalisations']
     df_hospitalizations = df_hospitalizations[df_hospitalizations['State'] != 'National']
-    df_hospitalizations = df_hospitalizations.groupby('State')['Count'].sum().reset_index()
+    return df_hospitalizations.groupby('State', observed=True)['Count'].sum().reset_index()
+
+
+@cached_spec
+def hospitalizations_by_state(table):
+    return state_chart(state_counts(table))
+
+
+@cached_spec
+def state_chart(df_hospitalizations):
     chart = alt.Chart(df_hospitalizations).mark_bar().encode(
         y=alt.Y('Count:Q', title='Hospitalizations'),
         x=alt.X('State:N', title='State', sort='-y'),
@@ -14,11 +48,12 @@ def hospitalizations_by_state(table):
     return chart
 
 
+@cached_spec
 def hospitalizations_by_age(table):
     # For private hospitals they refer to the measure as "Patients" instead of "Hospitalisations",
     # We want to look at both
     df_ages = table[(table['Measure'] == 'Hospitalisations') | (table['Measure'] == 'Patients')]
-    df_ages = df_ages.groupby('Age group')['Count'].sum().reset_index()
+    df_ages = df_ages.groupby('Age group', observed=True)['Count'].sum().reset_index()
     # Plot hospitalizations per age group on a bar chart
     chart = alt.Chart(df_ages).mark_bar().encode(
         y=alt.Y('Count:Q', title='Hospitalizations'),
@@ -28,9 +63,10 @@ def hospitalizations_by_age(table):
     return chart
 
 
+@cached_spec
 def hospitalizations_by_indigenous_status(table):
     indigenous_status = table[(table['Demographic type'] == 'Indigenous status') & (table['Measure'] == 'Hospitalisations')]
-    indigenous_status = indigenous_status.groupby('Demographic')['Count'].sum().reset_index()
+    indigenous_status = indigenous_status.groupby('Demographic', observed=True)['Count'].sum().reset_index()
 
     # Calculate the total to find percentages
     total_count = indigenous_status['Count'].sum()
@@ -45,9 +81,10 @@ def hospitalizations_by_indigenous_status(table):
     return chart
 
 
+@cached_spec
 def hospitalizations_by_socioeconomic_status(table):
     socioeconomic_status = table[(table['Demographic type'] == 'SEIFA quintile of usual residence') & (table['Measure'] == 'Hospitalisations')]
-    socioeconomic_status = socioeconomic_status.groupby('Demographic')['Count'].sum().reset_index()
+    socioeconomic_status = socioeconomic_status.groupby('Demographic', observed=True)['Count'].sum().reset_index()
     chart = alt.Chart(socioeconomic_status).mark_bar().encode(
         y=alt.Y('Count:Q', title='Hospitalizations'),
         x=alt.X('Demographic:N', title='SEIFA Quintile'),
@@ -56,9 +93,10 @@ def hospitalizations_by_socioeconomic_status(table):
     return chart
 
 
+@cached_spec
 def hospitalizations_by_remoteness(table):
     remoteness = table[(table['Demographic type'] == 'Remoteness area of usual residence') & (table['Measure'] == 'Hospitalisations')]
-    remoteness = remoteness.groupby('Demographic')['Count'].sum().reset_index()
+    remoteness = remoteness.groupby('Demographic', observed=True)['Count'].sum().reset_index()
     chart = alt.Chart(remoteness).mark_bar().encode(
         y=alt.Y('Count:Q', title='Hospitalizations'),
         x=alt.X('Demographic:N', title='Remoteness Area', sort='-y'),
@@ -67,24 +105,48 @@ def hospitalizations_by_remoteness(table):
     return chart
 
 
+def outcome_counts_by_group(table):
+    consumer_groups = table['Consumer group'].astype(object).replace({
+        #change the consumer group "Completed inpatient care to Acute inpatient"
+        'Completed acute inpatient': 'Acute inpatient',
+        #change consumer group "Completed ambulatory care to Ambulatory"
+        'Completed ambulatory': 'Ambulatory',
+        #change consuer group "Ongoing ambulatory to Ambulatory"
+        'Ongoing ambulatory': 'Ambulatory'
+    })
+    # One outcome breakdown per consumer group, in the order the groups first appear
+    return {
+        consumer_group: group.groupby('Outcome group', observed=True)['Count'].sum().reset_index()
+        for consumer_group, group in table.groupby(consumer_groups, observed=True, sort=False, dropna=False)
+    }
+
+
 def clinical_outcomes(table):
-    #change the consumer group "Completed inpatient care to Acute inpatient"
-    table['Consumer group'] = table['Consumer group'].replace('Completed acute inpatient', 'Acute inpatient')
-    #change consumer group "Completed ambulatory care to Ambulatory"
-    table['Consumer group'] = table['Consumer group'].replace('Completed ambulatory', 'Ambulatory')
-    #change consuer group "Ongoing ambulatory to Ambulatory"
-    table['Consumer group'] = table['Consumer group'].replace('Ongoing ambulatory', 'Ambulatory')
-    consumer_groups = list(table['Consumer group'].unique())
-    selected_consumer_group = st.selectbox("Consumer group", options=consumer_groups)
-    table = table[table['Consumer group'] == selected_consumer_group]
-
-    outcome_groups = table.groupby('Outcome group')['Count'].sum().reset_index()
+    return outcomes_chart(outcome_counts_by_group(table))
+
+
+def outcomes_chart(outcomes_by_group):
+    selected_consumer_group = st.selectbox("Consumer group", options=list(outcomes_by_group), key="consumer_group")
+    outcome_groups = outcomes_by_group.get(selected_consumer_group, NO_OUTCOMES)
+    return outcome_groups_chart(outcome_groups), selected_consumer_group
+
+
+@cached_spec
+def outcome_groups_chart(outcome_groups):
     chart = alt.Chart(outcome_groups).mark_arc(innerRadius=50).encode(
         theta='Count:Q',
         color=alt.Color('Outcome group:N', title='Clinical Outcome', scale=alt.Scale(scheme='viridis')),
         tooltip=['Outcome group:N', 'Count:Q']
     )
-    return chart, selected_consumer_group
+    return chart
+
+
+def diagnosis_counts_by_age_band(table):
+    # One diagnosis breakdown per age band, in the order the age bands first appear
+    return {
+        age_band: group.groupby('Principal diagnosis', observed=True)['Count'].sum().reset_index()
+        for age_band, group in table.groupby('Age band', observed=True, sort=False, dropna=False)
+    }
 
 
 def diagnoses(table, filter_param):
@@ -94,11 +156,18 @@ def diagnoses(table, filter_param):
     #selected_setting = st.radio("Setting", options=clinical_setting, horizontal=True)
     #table = table[table['Setting'] == selected_setting]
     table = table[table['Setting'] == filter_param]
+    return diagnoses_chart(diagnosis_counts_by_age_band(table))
+
+
+def diagnoses_chart(diagnoses_by_age_band):
     # filter for age  band
-    age_bands = list(table['Age band'].unique())
-    selected_age_band = st.selectbox("Age band", options=age_bands)
-    table = table[table['Age band'] == selected_age_band]
-    diagnoses = table.groupby('Principal diagnosis')['Count'].sum().reset_index()
+    selected_age_band = st.selectbox("Age band", options=list(diagnoses_by_age_band), key="age_band")
+    diagnoses = diagnoses_by_age_band.get(selected_age_band, NO_DIAGNOSES)
+    return diagnosis_counts_chart(diagnoses)
+
+
+@cached_spec
+def diagnosis_counts_chart(diagnoses):
     chart = alt.Chart(diagnoses).mark_bar().encode(
         x=alt.Y('Count:Q', title='Diagnoses'),
         y=alt.X('Principal diagnosis:N', title='Diagnosis', sort='-x'),
@@ -107,8 +176,17 @@ def diagnoses(table, filter_param):
     return chart
 
 
+def problem_counts(table):
+    return table.groupby('HoNOSCA scale', observed=True)['Count'].sum().reset_index()
+
+
+@cached_spec
 def admission_problems(table):
-    problems = table.groupby('HoNOSCA scale')['Count'].sum().reset_index()
+    return problems_chart(problem_counts(table))
+
+
+@cached_spec
+def problems_chart(problems):
     chart = alt.Chart(problems).mark_bar().encode(
         x=alt.Y('Count:Q', title='Admissions'),
         y=alt.X('HoNOSCA scale:N', title='Problem on Admission', sort='-x'),
@@ -117,53 +195,43 @@ def admission_problems(table):
     return chart
 
 
-def hospitalizations_by_diagnosis_over_time(table):
-    #remove empty string from Principal diagnosis
-    table = table[table['Principal diagnosis'] != ' ']
+def hospitalizations_by_diagnosis_over_time(trends):
+    # trends holds the dense (age band x diagnosis x year) counts from aggregates.trend_counts
     #add age filter from column Age band
-    ages = list(table['Age band'].unique())
+    ages = trends.values('Age band')
     default_age = "18-64 years"
     ages.insert(0, ages.pop(ages.index(default_age)))
-    selected_age_band = st.selectbox("Ages", options=ages)
-    table = table[table['Age band'] == selected_age_band]
-    default_diagnoses = ['(F32) Depressive episode', '(F99) Mental disorder not otherwise specified']
+    # Picking another age band starts again from the default diagnoses
+    selected_age_band = st.selectbox("Ages", options=ages, key="ages", on_change=st.session_state.pop, args=("diagnoses", None))
     #default_diagnoses = ['(F32) Depressive episode', '(F31) Bipolar affective disorders', '(F20) Schizophrenia']
-    diagnoses = st.multiselect("Diagnoses", options=table['Principal diagnosis'].unique(), default=default_diagnoses)
-    distribution = table[table['Principal diagnosis'].isin(diagnoses)].groupby(['Year', 'Principal diagnosis'])['Count'].sum().reset_index()
+    options = trends.values('Principal diagnosis', {'Age band': selected_age_band})
+    # Not every age band has all of the default diagnoses, which only apply until a selection is kept in the session state
+    default = None if "diagnoses" in st.session_state else [diagnosis for diagnosis in DEFAULT_DIAGNOSES if diagnosis in options]
+    diagnoses = st.multiselect("Diagnoses", options=options, default=default, key="diagnoses")
+    return diagnosis_trends_chart(trends, selected_age_band, tuple(diagnoses)), selected_age_band
+
+
+@cached_spec
+def diagnosis_trends_chart(trends, selected_age_band, diagnoses):
+    distribution = trends.frame({'Age band': selected_age_band, 'Principal diagnosis': diagnoses}, ['Year', 'Principal diagnosis'])
     chart = alt.Chart(distribution).mark_line().encode(
         x=alt.X('Year:O', title='Year'),
         y=alt.Y('Count:Q', title='Hospitalizations'),
         tooltip=['Year:O', 'Count:Q'],
         color='Principal diagnosis:N',
     ).interactive()
-    return chart, selected_age_band
-
-
-def hospitalizations_by_age_sex_over_time(table, filter_param):
-    #remove age group 0-11
-    table = table[table['Age group'] != '0–11 years']
-    #rename age group 18-24 to 18-64
-    table['Age group'] = table['Age group'].replace('12–17 years', '11-17 years')
-    table['Age group'] = table['Age group'].replace('18–24 years', '18-64 years')
-    #do the same for other age groups
-    table['Age group'] = table['Age group'].replace('25–34 years', '18-64 years')
-    table['Age group'] = table['Age group'].replace('35–44 years', '18-64 years')
-    table['Age group'] = table['Age group'].replace('45–54 years', '18-64 years')
-    table['Age group'] = table['Age group'].replace('55–64 years', '18-64 years')
-    #rename other ages to 65 years and over
-    table['Age group'] = table['Age group'].replace('65–74 years', '65 years and over')
-    table['Age group'] = table['Age group'].replace('75–84 years', '65 years and over')
-    table['Age group'] = table['Age group'].replace('85 years and over', '65 years and over')
-    table['Age group'] = table['Age group'].replace('85 years and older', '65 years and over')
-                                                    
-
-    table = table[(table['Measure'] == 'Hospitalisations') | (table['Measure'] == 'Patients')]
-    table = table[(table['Sex'] == "Female") | (table['Sex'] == 'Male')]
+    return chart
+
+
+@cached_spec
+def hospitalizations_by_age_sex_over_time(trends, filter_param):
+    # trends holds the dense (age band x year x sex) counts of hospitalisations and patients from aggregates.trend_counts,
+    # where the age groups are already mapped onto the age bands (see AGE_BANDS) and the 0-11 age group is left out
+    table = trends.frame({'Age band': filter_param}, ['Year', 'Sex'])
     #ages = list(table['Age group'].unique())
     #default_age = '18–64 years'
     #ages.insert(0, ages.pop(ages.index(default_age)))
     #age = st.selectbox("Select Age Group", options=ages)
-    table = table[table['Age group'] == filter_param].groupby(['Year', 'Sex'])['Count'].sum().reset_index()
     chart = alt.Chart(table).mark_line().encode(
         x=alt.X('Year:O', title='Year'),
         y=alt.Y('Count:Q', title='Hospitalizations'),
@@ -182,12 +250,13 @@ def hospitalizations_by_age_sex_over_time(table, filter_param):
     return chart
 
 
+@cached_spec
 def diagnosis_age(table):
     # some funky non existent category in Age Group
     age_bands = ['11-17 years', '18-64 years', '65 years and over']
     table = table[table['Age band'].isin(age_bands)]
 
-    table = table.groupby(['Principal diagnosis', 'Age band'])['Count'].sum().reset_index()
+    table = table.groupby(['Principal diagnosis', 'Age band'], observed=True)['Count'].sum().reset_index()
 
     chart = alt.Chart(table).mark_bar().encode(
         y=alt.Y('Principal diagnosis:O', title='Diagnosis'),
@@ -203,8 +272,23 @@ def pick_own_variables(table):
     # pick your own variables
     x = st.selectbox("X", options=table.columns)
     y = st.selectbox("Y", options=table.columns)
-    chart = alt.Chart(table).mark_point().encode(
-        x=alt.X(x),
-        y=alt.Y(y)
+    # Send a reduced table (within the row/byte budget) alongside the spec instead of embedding every row in it
+    points = reduction.reduce_points(table, x, y)
+    return variables_chart(x, encoding_type(points[x]), y, encoding_type(points[y])), points
+
+
+def encoding_type(values):
+    # The data is not embedded in the spec, so Altair cannot infer the encoding types itself
+    return 'quantitative' if pd.api.types.is_numeric_dtype(values) else 'nominal'
+
+
+@cached_spec
+def variables_chart(x, x_type, y, y_type):
+    chart = alt.Chart().mark_point().encode(
+        x=alt.X(field=x, type=x_type),
+        y=alt.Y(field=y, type=y_type),
+        # Each point can stand for several rows of the table once it has been reduced
+        size=alt.Size('Rows:Q', title='Rows'),
+        tooltip=[alt.Tooltip(field=x, type=x_type), alt.Tooltip(field=y, type=y_type), 'Rows:Q']
     )
     return chart
@@ -0,0 +1,99 @@
+"""Warm every cache the dashboard uses: the cleaned datasets, the year aggregates and every chart spec.
+
+Run ``python preload.py`` at deploy time, before starting Streamlit, so the on-disk cache of both workbooks is
+built before the first visitor arrives. The in-memory caches (datasets, aggregates and chart specs) belong to each
+server process, so the app also runs ``preload()`` once per process in a background thread, which fills them while
+the first page is being viewed. Set DASHBOARD_PRELOAD=0 to switch that off.
+"""
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+import streamlit as st
+import aggregates
+import load_data
+import plots
+import schema
+
+PRELOAD_ENV = 'DASHBOARD_PRELOAD'
+PRELOAD_THREAD = 'preload'
+
+
+def warm_data():
+    for name in schema.DATASETS:
+        load_data.dataset(name)
+
+
+def warm_aggregates():
+    aggregates.year_aggregates()
+    aggregates.trend_counts()
+
+
+def warm_charts():
+    # Build each chart the way streamlit_app.py does, so the cache keys (and shared tables) are the same
+    dataset = load_data.dataset
+    # "Overview" tab
+    plots.hospitalizations_by_state(dataset('hospitalizations_by_state'))
+    plots.hospitalizations_by_age(dataset('hospitalizations_by_age'))
+    plots.hospitalizations_by_socioeconomic_status(dataset('hospitalizations_by_demographic'))
+    plots.hospitalizations_by_remoteness(dataset('hospitalizations_by_demographic'))
+    plots.hospitalizations_by_indigenous_status(dataset('hospitalizations_by_demographic'))
+    plots.diagnosis_age(dataset('diagnoses_by_age_band'))
+    # "Analysis by Year" tab, for every year and filter value
+    for key, value in aggregates.year_aggregates().items():
+        if key[0] == 'hospitalizations_by_state':
+            plots.state_chart(value)
+        elif key[0] == 'problems_by_scale':
+            plots.problems_chart(value)
+        elif key[0] == 'outcomes_by_consumer_group':
+            for outcome_groups in value.values():
+                plots.outcome_groups_chart(outcome_groups)
+        elif key[0] == 'diagnoses_by_age_band':
+            for diagnoses in value.values():
+                plots.diagnosis_counts_chart(diagnoses)
+    # "Trends Over Time" tab, for every age band with the default diagnoses
+    trend_counts = aggregates.trend_counts()
+    for age_band in trend_counts['diagnoses_by_age_band'].values('Age band'):
+        plots.diagnosis_trends_chart(trend_counts['diagnoses_by_age_band'], age_band, tuple(plots.DEFAULT_DIAGNOSES))
+        plots.hospitalizations_by_age_sex_over_time(trend_counts['hospitalizations_by_age_band'], age_band)
+
+
+STAGES = (('data', warm_data), ('aggregates', warm_aggregates), ('charts', warm_charts))
+
+
+def preload(verbose=False):
+    for name, warm in STAGES:
+        start = time.perf_counter()
+        warm()
+        if verbose:
+            print('{:<12} {:>9.2f} ms'.format(name, (time.perf_counter() - start) * 1000))
+
+
+@st.cache_resource(show_spinner=False)
+def start_background():
+    # Runs once per server process (the first session to get here starts it)
+    if os.environ.get(PRELOAD_ENV, '1') == '0':
+        return None
+    # The cached functions warn about having no session when called from this thread, which is expected here
+    # (but not in the threads of the sessions)
+    logging.getLogger('streamlit.runtime.scriptrunner_utils.script_run_context').addFilter(lambda record: record.threadName != PRELOAD_THREAD)
+    thread = threading.Thread(target=preload, name=PRELOAD_THREAD, daemon=True)
+    thread.start()
+    return thread
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.parse_args(argv)
+    # Outside of `streamlit run` every cached call logs a "no runtime" warning
+    st.get_option('logger.level')  # parse the config first, as that resets the log level
+    st.logger.set_log_level('error')
+    start = time.perf_counter()
+    preload(verbose=True)
+    print('Warmed every cache in {:.2f} s'.format(time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,45 @@
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+# Budget for the rows sent to the browser with a single chart (Altair refuses to embed more than 5000 rows)
+CHART_MAX_ROWS = int(os.environ.get('CHART_MAX_ROWS', 5000))
+# - The data is sent as Arrow (see ui.chart), so this is the size of its Arrow buffers
+CHART_MAX_BYTES = int(os.environ.get('CHART_MAX_BYTES', 500_000))
+
+
+def row_budget(df, max_rows=CHART_MAX_ROWS, max_bytes=CHART_MAX_BYTES):
+    # Estimate the Arrow size of a row from the first few rows, and keep within both the row and byte budgets
+    sample = df.head(100)
+    if sample.empty:
+        return max_rows
+    bytes_per_row = pa.Table.from_pandas(sample, preserve_index=False).nbytes / len(sample)
+    return max(1, min(max_rows, int(max_bytes // bytes_per_row)))
+
+
+def bin_numeric(points, columns, bins):
+    # Replace each numeric value with the midpoint of its bin, then merge the points that now coincide
+    points = points.copy()
+    for col in columns:
+        values = points[col]
+        if pd.api.types.is_numeric_dtype(values) and values.nunique() > bins:
+            edges = np.linspace(values.min(), values.max(), bins + 1)
+            index = np.clip(np.digitize(values, edges) - 1, 0, bins - 1)
+            # Missing values stay missing rather than being put in the top bin (digitize places NaN past the last edge)
+            points[col] = np.where(values.isna(), np.nan, ((edges[:-1] + edges[1:]) / 2)[index])
+    return points.groupby(columns, observed=True, dropna=False)['Rows'].sum().reset_index()
+
+
+def reduce_points(table, x, y, max_rows=CHART_MAX_ROWS, max_bytes=CHART_MAX_BYTES):
+    # Step 1: Pre-aggregate, so each distinct (x, y) point is sent once with the number of rows it stands for
+    columns = list(dict.fromkeys([x, y]))
+    points = table.groupby(columns, observed=True, dropna=False).size().reset_index(name='Rows')
+    limit = row_budget(points, max_rows, max_bytes)
+    # Step 2: Bin numeric axes into a grid that fits the budget
+    if len(points) > limit:
+        points = bin_numeric(points, columns, max(2, int(limit ** (1 / len(columns)))))
+    # Step 3: As a last resort take a (repeatable) sample, keeping the most common points more often
+    if len(points) > limit:
+        points = points.sample(limit, weights='Rows', random_state=0).sort_index()
+    return points
@@ -0,0 +1,49 @@
+import numpy as np
+
+# Every table the dashboard uses, under a stable name. Tables are found by the ID of the sheet they are cleaned from
+# (which stays the same when a release adds or reorders sheets) rather than by their position in the workbook, and
+# have to provide the dimension columns declared here.
+DATASETS = {
+    'hospitalizations_by_age': {
+        'workbook': 'admitted-patients',
+        'sheet': 'Table AC.3',
+        'dimensions': ['Separation type', 'Sector', 'Measure', 'Care setting', 'Sex', 'Age group'],
+    },
+    'hospitalizations_by_state': {
+        'workbook': 'admitted-patients',
+        'sheet': 'Table AC.4',
+        'dimensions': ['Separation type', 'State', 'Measure', 'Care setting', 'Sector'],
+    },
+    'hospitalizations_by_demographic': {
+        'workbook': 'admitted-patients',
+        'sheet': 'Table AC.5',
+        'dimensions': ['Separation type', 'Sector', 'Measure', 'Care setting', 'Demographic type', 'Demographic'],
+    },
+    'problems_by_scale': {
+        'workbook': 'consumer-outcomes',
+        'sheet': 'Table NOCC.8',
+        'dimensions': ['State', 'Setting', 'HoNOSCA scale', 'Count_Desc'],
+    },
+    'diagnoses_by_age_band': {
+        'workbook': 'consumer-outcomes',
+        'sheet': 'Table NOCC.12',
+        'dimensions': ['State', 'Age band', 'Setting', 'Principal diagnosis', 'Count_Desc'],
+    },
+    'outcomes_by_consumer_group': {
+        'workbook': 'consumer-outcomes',
+        'sheet': 'Table NOCC.21',
+        'dimensions': ['State', 'Consumer group', 'Outcome group', 'Count_Desc'],
+    },
+}
+# Columns every dataset has after cleaning, in addition to its dimensions
+MEASURES = {'Year': np.int16, 'Count': np.float64}
+
+
+def conform(name, table):
+    # Check a cleaned table has the declared columns and return just those, with dimensions as categoricals
+    dimensions = DATASETS[name]['dimensions']
+    missing = [col for col in dimensions + list(MEASURES) if col not in table.columns]
+    if missing:
+        raise ValueError('{} ({}) is missing the columns {}'.format(name, DATASETS[name]['sheet'], missing))
+    dtypes = {**{col: 'category' for col in dimensions}, **MEASURES}
+    return table[dimensions + list(MEASURES)].astype(dtypes)
@@ -21,6 +21,9 @@ if [ $? -ne 0 ]; then
     exit 1
 fi
 
+# Build the data cache before the app starts, so the first visitor doesn't wait for the workbooks to be parsed
+python preload.py
+
 # Run the Streamlit app
 streamlit run streamlit_app.py
 
@@ -1,6 +1,5 @@
 import streamlit as st
-import plots
-import load_data
+import instrumentation
 import ui
 
 ##########################################################################
@@ -10,122 +9,151 @@ import ui
 # Since the dashboard will use multiple graphs, we will default to a wide layout
 st.set_page_config(layout="wide")
 # Inject custom CSS stylesheet
-load_data.load_css("styles.css")
+ui.load_css("styles.css")
+# Time the data loading, plots and chart rendering when profiling is switched on (DASHBOARD_PROFILE=1 or ?profile=1)
+instrumentation.start_rerun()
+instrumentation.install(ui, 'render', measure_args=True)
+
+# Provide a title to the page
+st.write("## Mental Health in Australia")
+st.write("Mental Health is a serious concern in Australia. Explore the data to learn more.")
+
+# Setup the Tabs
+# - Switching tabs reruns the app, and only the open tab's charts are built on each rerun
+tab1, tab2, tab3 = st.tabs(["Overview", "Analysis by Year", "Trends Over Time"], key="active_tab", on_change="rerun")
+# - Widgets in closed tabs are not drawn, so keep their selections alive for when their tab is opened again
+for key in ("year", "consumer_group", "age_band", "ages", "diagnoses"):
+    if key in st.session_state:
+        st.session_state[key] = st.session_state[key]
 
 ##########################################################################
 # LOAD DATA
 ##########################################################################
 
-dfs_admitted = load_data.admitted_patients_data()
-dfs_outcomes = load_data.consumer_outcomes_data()
+# The page shell above is drawn before pandas, altair and the data are loaded, which takes a moment in a new server process
+with st.spinner("Loading the dashboard..."):
+    import plots
+    import load_data
+    import aggregates
+    import preload
+    instrumentation.install(load_data, 'load_data')
+    instrumentation.install(aggregates, 'aggregates')
+    instrumentation.install(plots, 'plots')
+    # Fill the data, aggregate and chart caches of every tab in the background, once per server process
+    preload.start_background()
+
+# Datasets are looked up by name (see schema.py) with load_data.dataset, and each one is only read the first time
+# a chart in the open tab needs it
 # st.dataframe(table) used for debgugging
 
 ##########################################################################
 # DASHBOARD
 ##########################################################################
 
-# Provide a title to the page
-st.write("## Mental Health in Australia")
-st.write("Mental Health is a serious concern in Australia. Explore the data to learn more.")
-
-# Setup the Tabs
-tab1, tab2, tab3 = st.tabs(["Overview", "Analysis by Year", "Trends Over Time"])
-
 # Create Tab 1: Overview Tab
 with tab1:
-    # Provide a Title for the Tab
-    st.markdown(
-        f'''
-            <div class="tab-explainer">
-                <h1 class="card-title">Overview: Key Trends and Statistics</h1>
-                <p class="card-desc italics">
-                    Below we show a snapshot of the mental health crisis in Australia. 
-                    For a more detailed and interactive exploration, select the explore in more detail tab above.
-                </p>
-            </div>
-            ''',
-        unsafe_allow_html=True
-    )
-    # Setup three columns
-    col1, col2, col3 = st.columns(3, gap="medium")
-    with col1:
-        ui.chart_card(
-            "Hospitalizations by State",
-            "The number of mental health hospital admissions across each of the states in Australia.",
-            plots.hospitalizations_by_state(dfs_admitted['Table 4'])
-        )
-        ui.chart_card(
-            "Hospitalizations by Socioeconomic Status",
-            "Mental health is influenced by socioeconomic status. The population living in the 20% of areas with the greatest overall level of disadvantage is described as the lowest socioeconomic group (Quintile 1). The 20% at the other end of the scale (the top fifth - Quintile 5) is described as the highest socioeconomic group.",
-            plots.hospitalizations_by_socioeconomic_status(dfs_admitted['Table 5'])
-        )
-    with col2:
-        ui.chart_card(
-            "Hospitalizations by Age",
-            "The number of Australian hospital admissions across different age groups.",
-            plots.hospitalizations_by_age(dfs_admitted['Table 3'])
-        )
-        ui.chart_card(
-            "Hospitalizations by Remoteness",
-            "Location can have an influence on mental health. Below you can see the distribution based on the level of remoteness.",
-            plots.hospitalizations_by_remoteness(dfs_admitted['Table 5'])
+    if tab1.open:
+        # Provide a Title for the Tab
+        st.markdown(
+            f'''
+                <div class="tab-explainer">
+                    <h1 class="card-title">Overview: Key Trends and Statistics</h1>
+                    <p class="card-desc italics">
+                        Below we show a snapshot of the mental health crisis in Australia. 
+                        For a more detailed and interactive exploration, select the explore in more detail tab above.
+                    </p>
+                </div>
+                ''',
+            unsafe_allow_html=True
         )
-    with col3:
-        ui.chart_card(
-            "Hospitalizations by Diagnosis and Age Group",
-            "There are a range of mental health diagnoses and the type of diagnosis can be influenced by age group.",
-            plots.diagnosis_age(dfs_outcomes['Table 12'])
+        # Setup three columns
+        col1, col2, col3 = st.columns(3, gap="medium")
+        with col1:
+            ui.chart_card(
+                "Hospitalizations by State",
+                "The number of mental health hospital admissions across each of the states in Australia.",
+                plots.hospitalizations_by_state(load_data.dataset('hospitalizations_by_state'))
+            )
+            ui.chart_card(
+                "Hospitalizations by Socioeconomic Status",
+                "Mental health is influenced by socioeconomic status. The population living in the 20% of areas with the greatest overall level of disadvantage is described as the lowest socioeconomic group (Quintile 1). The 20% at the other end of the scale (the top fifth - Quintile 5) is described as the highest socioeconomic group.",
+                plots.hospitalizations_by_socioeconomic_status(load_data.dataset('hospitalizations_by_demographic'))
+            )
+        with col2:
+            ui.chart_card(
+                "Hospitalizations by Age",
+                "The number of Australian hospital admissions across different age groups.",
+                plots.hospitalizations_by_age(load_data.dataset('hospitalizations_by_age'))
+            )
+            ui.chart_card(
+                "Hospitalizations by Remoteness",
+                "Location can have an influence on mental health. Below you can see the distribution based on the level of remoteness.",
+                plots.hospitalizations_by_remoteness(load_data.dataset('hospitalizations_by_demographic'))
+            )
+        with col3:
+            ui.chart_card(
+                "Hospitalizations by Diagnosis and Age Group",
+                "There are a range of mental health diagnoses and the type of diagnosis can be influenced by age group.",
+                plots.diagnosis_age(load_data.dataset('diagnoses_by_age_band'))
+            )
+            ui.chart_card(
+                "Hospitalizations by Indigenous Status",
+                "The distribution of mental health hospital admissions in Australia across Indigenous and non-Indigenous communities.",
+                plots.hospitalizations_by_indigenous_status(load_data.dataset('hospitalizations_by_demographic'))
+            )
+
+with tab2:
+    if tab2.open:
+        # Provide a Title for the Tab
+        st.markdown(
+            f'''
+                <div class="tab-explainer">
+                    <h1 class="card-title">Analysis by Year</h1>
+                    <p class="card-desc italics">
+                        Below we show a more detailed snapshot of the mental health crisis and how it has changed year on year. 
+                        The charts are designed to be filterable and interactive.
+                    </p>
+                </div>
+                ''',
+            unsafe_allow_html=True
         )
-        ui.chart_card(
-            "Hospitalizations by Indigenous Status",
-            "The distribution of mental health hospital admissions in Australia across Indigenous and non-Indigenous communities.",
-            plots.hospitalizations_by_indigenous_status(dfs_admitted['Table 5'])
+
+        # Group-by results for every year, built from the datasets of this tab
+        year_aggregates = aggregates.year_aggregates()
+
+        # Year Slider
+        year = st.slider(
+            label="Select a Year",
+            min_value=aggregates.FIRST_YEAR,  # set to 2014 as it is the earliest year in the dfs_outcome dataset
+            max_value=load_data.dataset('hospitalizations_by_state')["Year"].max(),
+            # Start on 2016, and after that on the year kept in the session state
+            value=None if "year" in st.session_state else 2016,
+            key="year"
         )
 
-with tab2:
-    # Provide a Title for the Tab
-    st.markdown(
-        f'''
-            <div class="tab-explainer">
-                <h1 class="card-title">Analysis by Year</h1>
-                <p class="card-desc italics">
-                    Below we show a more detailed snapshot of the mental health crisis and how it has changed year on year. 
-                    The charts are designed to be filterable and interactive.
-                </p>
-            </div>
-            ''',
-        unsafe_allow_html=True
-    )
-
-    # Year Slider
-    year = st.slider(
-        label="Select a Year",
-        min_value=2014,  # set to 2014 as it is the earliest year in the dfs_outcome dataset
-        max_value=dfs_admitted['Table 1']["Year"].max(),
-        value=2016
-    )
-
-    # Setup two columns
-    col1, col2 = st.columns(2, gap="medium")
-
-    with col1:
-        with st.container(border=True):
-            ui.banner("Hospitalizations by State", "While hospital admissions for mental health have historically been the highest in New South Wales, followed by Victoria and then Queensland; in recent years, the number of admissions in these states have started to become equivalent.")
-            st.altair_chart(plots.hospitalizations_by_state(dfs_admitted['Table 4'][dfs_admitted['Table 4']['Year'] == year]), use_container_width=True)
-        with st.container(border=True):
-            ui.banner("Clinical Outcomes Relative to Consumer Group", "Depending on the patient's admission status, clinical outcomes can vary. For example, those who complete an acute inpatient admission more often experience significant improvement. You can choose the consumer group with the filter below. Please note that this also filters the Diagnoses table in this tab.", withFilters=True)
-            chart, filter_param = plots.clinical_outcomes(dfs_outcomes['Table 21'][dfs_outcomes['Table 21']['Year'] == year])
-            #st.altair_chart(plots.clinical_outcomes(dfs_outcomes['Table 21'][dfs_outcomes['Table 21']['Year'] == year]), use_container_width=True)
-            st.altair_chart(chart, use_container_width=True)
-    with col2:
-        with st.container(border=True):
-            ui.banner("Reasons Leading to Hospital Admissions", "There are several different behaviours identified and reported that lead to a mental health admission. The reasons and their frequency of being reported can be observed below.")
-            st.altair_chart(plots.admission_problems(dfs_outcomes['Table 8'][dfs_outcomes['Table 8']['Year'] == year]), use_container_width=True)
-        with st.container(border=True):
-            ui.banner("Diagnosis Based on Admission Status and Age", "Here we show the ICD-10 codes that reveal the types of diagnoses and their frequency based on age and admission setting. To filter this chart according to the consumer group (i.e. acute inpatient versus ambulatory care), select the option on the donut chart and it will automatically filter this chart as well.", withFilters=True)
-            st.altair_chart(plots.diagnoses(dfs_outcomes['Table 12'][dfs_outcomes['Table 12']['Year'] == year], filter_param), use_container_width=True)
+        # Setup two columns
+        col1, col2 = st.columns(2, gap="medium")
+
+        with col1:
+            with st.container(border=True):
+                ui.banner("Hospitalizations by State", "While hospital admissions for mental health have historically been the highest in New South Wales, followed by Victoria and then Queensland; in recent years, the number of admissions in these states have started to become equivalent.")
+                ui.chart(plots.state_chart(year_aggregates[('hospitalizations_by_state', year)]))
+            with st.container(border=True):
+                ui.banner("Clinical Outcomes Relative to Consumer Group", "Depending on the patient's admission status, clinical outcomes can vary. For example, those who complete an acute inpatient admission more often experience significant improvement. You can choose the consumer group with the filter below. Please note that this also filters the Diagnoses table in this tab.", withFilters=True)
+                chart, filter_param = plots.outcomes_chart(year_aggregates[('outcomes_by_consumer_group', year)])
+                #st.altair_chart(plots.clinical_outcomes(load_data.dataset('outcomes_by_consumer_group')[load_data.dataset('outcomes_by_consumer_group')['Year'] == year]), use_container_width=True)
+                ui.chart(chart)
+        with col2:
+            with st.container(border=True):
+                ui.banner("Reasons Leading to Hospital Admissions", "There are several different behaviours identified and reported that lead to a mental health admission. The reasons and their frequency of being reported can be observed below.")
+                ui.chart(plots.problems_chart(year_aggregates[('problems_by_scale', year)]))
+            with st.container(border=True):
+                ui.banner("Diagnosis Based on Admission Status and Age", "Here we show the ICD-10 codes that reveal the types of diagnoses and their frequency based on age and admission setting. To filter this chart according to the consumer group (i.e. acute inpatient versus ambulatory care), select the option on the donut chart and it will automatically filter this chart as well.", withFilters=True)
+                # Diagnoses are only aggregated for the settings that appear in each year
+                ui.chart(plots.diagnoses_chart(year_aggregates.get(('diagnoses_by_age_band', year, filter_param), {})))
 
-    with tab3:
+with tab3:
+    if tab3.open:
         # Provide a Title for the Tab
         st.markdown(
             f'''
@@ -138,12 +166,20 @@ with tab2:
                 ''',
             unsafe_allow_html=True
         )
+        # Counts by age band, diagnosis, sex and year, which every selection below is sliced from
+        trend_counts = aggregates.trend_counts()
         with st.container(border=True):
             ui.banner("Number of Hospitalizations by Diagnosis Over Time", "Diagnostic trends have been changing over time. You can select specific diagnoses based on ICD-10 codes below and compare how they have changed over time. Select an age group to view, and this will also filter the Hospitalizations by Year and Age Group Over Time chart below.")
-            chart, filter_param = plots.hospitalizations_by_diagnosis_over_time(dfs_outcomes['Table 12'])
-            st.altair_chart(chart, use_container_width=True)
+            chart, filter_param = plots.hospitalizations_by_diagnosis_over_time(trend_counts['diagnoses_by_age_band'])
+            ui.chart(chart)
         with st.container(border=True):
             ui.banner("Hospitalizations by Year and Age Group Over Time", "The number of hospitalizations based according to Age and Sex has also been changing over time. Explore the trends in the changing landscape below. To filter this chart, please select an age group filter from the Diagnoses chart above.", withFilters=True)
-            st.altair_chart(plots.hospitalizations_by_age_sex_over_time(dfs_admitted['Table 3'], filter_param), use_container_width=True)
+            ui.chart(plots.hospitalizations_by_age_sex_over_time(trend_counts['hospitalizations_by_age_band'], filter_param))
+
+# ui.chart(*plots.pick_own_variables(load_data.dataset('hospitalizations_by_age')))
+
+##########################################################################
+# PROFILING
+##########################################################################
 
-    # st.altair_chart(plots.pick_own_variables(dfs_admitted['Table 3']))
+instrumentation.finish_rerun()
@@ -0,0 +1,70 @@
+import re
+import numpy as np
+import pandas as pd
+import pytest
+import load_data
+
+WORKBOOKS = {
+    load_data.ADMITTED_PATIENTS_PATH: r'Table AC\.\d+',
+    load_data.CONSUMER_OUTCOMES_PATH: r'Table NOCC\.\d+',
+}
+SHEETS = [
+    (path, sheet_name)
+    for path, pattern in WORKBOOKS.items()
+    for sheet_name in pd.ExcelFile(path).sheet_names if re.match(pattern, sheet_name)
+]
+
+
+def original_clean_table(xls, sheet_name):
+    # clean_table as it was before it was optimized, kept as the reference for its output
+    pd.set_option('future.no_silent_downcasting', True)
+    df = xls.parse(sheet_name=sheet_name, header=4)
+    replacements = {
+        "—": 0,  # "Rounded to zero"
+        ". .": np.nan,  # "Not applicable"
+        "n.a.": np.nan,  # "Not available"
+        "n.p.": np.nan,  # "Not published"
+        "nan": np.nan,  # nan string
+        ' ': np.nan
+    }
+    df.replace(replacements, inplace=True)
+    rows_to_drop = df.apply(lambda row: any(str(cell) == "Total" or str(cell) == "Subtotal" or str(cell) == "All" or str(cell) == "People" for cell in row), axis=1)
+    df = df[~rows_to_drop]
+    df.columns = [re.sub(r'[-–]', '-', col) for col in df.columns]
+    df.columns = [col.split('-')[0] if '-' in col else col for col in df.columns]
+    df = df.drop([col for col in df.columns if re.match(r"^Average.*annual.*change", col, re.DOTALL)], axis=1)
+    year_columns = [col for col in df.columns if col.isdigit()]
+    df = df.dropna(subset=year_columns, how='all')
+    df.rename(columns={"State\nTerritory": "State", "State/Territory": "State", "Count": "Count_Desc"}, inplace=True)
+    id_vars = [col for col in df.columns if col not in year_columns]
+    df_melted = pd.melt(df, id_vars=id_vars, value_vars=year_columns, var_name='Year', value_name='Count')
+    df_melted['Year'] = df_melted['Year'].astype(int)
+    return df_melted
+
+
+@pytest.fixture(scope='module')
+def workbooks():
+    # Each workbook is only opened once for all of its sheets
+    return {path: pd.ExcelFile(path) for path in WORKBOOKS}
+
+
+def clean_table(xls, sheet_name, reader):
+    excel_reader, load_data.EXCEL_READER = load_data.EXCEL_READER, reader
+    try:
+        return load_data.clean_table(xls, sheet_name)
+    finally:
+        load_data.EXCEL_READER = excel_reader
+
+
+@pytest.mark.parametrize('path, sheet_name', SHEETS, ids=[sheet_name for _, sheet_name in SHEETS])
+def test_matches_original(workbooks, path, sheet_name):
+    expected = original_clean_table(workbooks[path], sheet_name)
+    # Count has been converted to a numeric column since the tables are cached in columnar form
+    expected['Count'] = pd.to_numeric(expected['Count'], errors='coerce')
+    pd.testing.assert_frame_equal(clean_table(workbooks[path], sheet_name, 'pandas'), expected)
+
+
+@pytest.mark.parametrize('path, sheet_name', SHEETS, ids=[sheet_name for _, sheet_name in SHEETS])
+def test_streaming_reader_matches_pandas_reader(workbooks, path, sheet_name):
+    expected = clean_table(workbooks[path], sheet_name, 'pandas')
+    pd.testing.assert_frame_equal(clean_table(workbooks[path], sheet_name, 'streaming'), expected)
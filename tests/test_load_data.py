@@ -0,0 +1,30 @@
+import pandas as pd
+import pytest
+import load_data
+import schema
+
+
+def column_arrays(df):
+    for col in df.columns:
+        values = df[col].array
+        yield col, values.codes if isinstance(values, pd.Categorical) else df[col].to_numpy()
+
+
+@pytest.mark.parametrize('store', ['process', 'shared'])
+@pytest.mark.parametrize('name', list(schema.DATASETS))
+def test_datasets_are_read_only(monkeypatch, store, name):
+    # Datasets are shared by every session, so writing to one in place has to fail
+    monkeypatch.setattr(load_data, 'DATASET_STORE', store)
+    df = load_data.dataset.__wrapped__(name)
+    assert [col for col, values in column_arrays(df) if values.flags.writeable] == []
+    with pytest.raises(ValueError):
+        df.loc[0, 'Count'] = 0
+
+
+@pytest.mark.parametrize('loader', [load_data.admitted_patients_data, load_data.consumer_outcomes_data])
+def test_workbook_tables_are_read_only(loader):
+    tables = loader.__wrapped__()
+    with pytest.raises(TypeError):
+        tables['Table 1'] = None
+    for name, df in tables.items():
+        assert [col for col, values in column_arrays(df) if values.flags.writeable] == [], name
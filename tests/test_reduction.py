@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import reduction
+
+
+def random_points(rows, missing=0):
+    rng = np.random.default_rng(0)
+    table = pd.DataFrame({'x': rng.normal(size=rows), 'y': rng.normal(size=rows)})
+    table.loc[:missing - 1, 'y'] = np.nan
+    return table
+
+
+def test_points_within_budget_are_only_aggregated():
+    table = pd.DataFrame({'x': [1, 1, 2, 3], 'y': [5, 5, 6, 7]})
+    points = reduction.reduce_points(table, 'x', 'y')
+    assert points.to_dict('list') == {'x': [1, 2, 3], 'y': [5, 6, 7], 'Rows': [2, 1, 1]}
+
+
+def test_over_budget_table_fits_the_row_and_byte_budgets():
+    table = random_points(20_000)
+    points = reduction.reduce_points(table, 'x', 'y', max_rows=500)
+    assert len(points) <= 500
+    assert points['Rows'].sum() <= len(table)
+    points = reduction.reduce_points(table, 'x', 'y', max_bytes=4_000)
+    assert len(points) <= reduction.row_budget(points, max_bytes=4_000)
+
+
+def test_binning_keeps_every_row():
+    # With a budget that binning alone meets, every row is still counted exactly once
+    table = random_points(20_000)
+    points = reduction.reduce_points(table, 'x', 'y', max_rows=2_500)
+    assert len(points) <= 2_500
+    assert points['Rows'].sum() == len(table)
+
+
+def test_missing_values_are_not_binned():
+    table = random_points(20_000, missing=100)
+    points = reduction.reduce_points(table, 'x', 'y', max_rows=2_500)
+    missing = points[points['y'].isna()]
+    assert missing['Rows'].sum() == 100
+    # The other rows are binned exactly as they would be without the missing ones
+    expected = reduction.reduce_points(table.dropna(), 'x', 'y', max_rows=2_500)
+    pd.testing.assert_frame_equal(points.dropna().reset_index(drop=True), expected)
+
+
+def test_same_column_on_both_axes():
+    table = random_points(20_000)
+    points = reduction.reduce_points(table, 'x', 'x', max_rows=100)
+    assert list(points.columns) == ['x', 'Rows']
+    assert len(points) <= 100
+    assert points['Rows'].sum() == len(table)
@@ -1,6 +1,11 @@
 import streamlit as st
 
 
+def load_css(file_name):
+    with open(file_name) as f:
+        st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
+
+
 def chart_card(title, desc, plot):
     with st.container(border=True):
         # Card title
@@ -13,8 +18,13 @@ def chart_card(title, desc, plot):
             ''',
             unsafe_allow_html=True
         )
-        # Execute the function passed into chart_func
-        st.altair_chart(plot, use_container_width=True)
+        # Render the (cached) Vega-Lite spec returned by the plots module
+        chart(plot)
+
+
+def chart(plot, data=None):
+    # When the data is passed separately from the spec, Streamlit sends it to the browser as Arrow rather than JSON
+    st.vega_lite_chart(data, plot, width='stretch')
 
 
 def banner(title, desc, withFilters=False):